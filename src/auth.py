@@ -3,11 +3,23 @@ from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from sqlalchemy import select, update
-from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from src.config import SCOPES, CREDENTIALS_FILE
-from src.database.session import async_session_maker
+from src.database.session import async_session_maker, insert
 from src.database.models import User
+from src.state.backend import state_backend
+
+# Parsed credentials per user, so handlers don't hit the database and JSON-decode on
+# every update. Other replicas announce changes through the state backend.
+_creds_cache = {}
+
+def _on_invalidation(kind: str, key):
+    if kind == "creds":
+        _creds_cache.pop(int(key), None)
+    elif kind == "*":
+        _creds_cache.clear()
+
+state_backend.add_invalidation_listener(_on_invalidation)
 
 def get_flow():
     """Creates a Flow instance for OAuth."""
@@ -23,6 +35,10 @@ async def get_user_creds(user_id: int):
     Retrieves credentials for a user from the database.
     Refreshes them if expired.
     """
+    creds = _creds_cache.get(user_id)
+    if creds is not None and not creds.expired:
+        return creds
+
     async with async_session_maker() as session:
         stmt = select(User).where(User.telegram_id == user_id)
         result = await session.execute(stmt)
@@ -42,7 +58,8 @@ async def get_user_creds(user_id: int):
             except Exception as e:
                 print(f"Error refreshing token for {user_id}: {e}")
                 return None
-        
+
+        _creds_cache[user_id] = creds
         return creds
 
 async def save_user_creds(user_id: int, creds: Credentials):
@@ -51,7 +68,7 @@ async def save_user_creds(user_id: int, creds: Credentials):
     
     async with async_session_maker() as session:
         # Upsert (Insert or Replace)
-        stmt = sqlite_insert(User).values(
+        stmt = insert(User).values(
             telegram_id=user_id,
             credentials_json=creds_json
         )
@@ -65,6 +82,9 @@ async def save_user_creds(user_id: int, creds: Credentials):
         await session.execute(stmt)
         await session.commit()
 
+    _creds_cache[user_id] = creds
+    await state_backend.publish_invalidation("creds", user_id)
+
 async def get_all_authenticated_users():
     """Returns a list of all users who have credentials."""
     async with async_session_maker() as session:
@@ -1,41 +1,72 @@
+import asyncio
+import string
+from urllib.parse import urlsplit
 import telegram
+from telegram import MessageEntity
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
 import google.generativeai as genai
 import datetime
 from datetime import date
-from src.config import TELEGRAM_TOKEN, GEMINI_API_KEY
-from src.calendar_tools import create_calendar_event, delete_calendar_event_by_summary, list_upcoming_events, get_upcoming_events_soon, get_events_for_date
-from src.auth import get_user_creds, get_flow, save_user_creds, get_all_authenticated_users
+from src.config import TELEGRAM_TOKEN, GEMINI_API_KEY, WATCH_WEBHOOK_URL, WATCH_RECEIVER_HOST, WATCH_RECEIVER_PORT, GEMINI_REQUEST_TIMEOUT, GEMINI_CALL_DEADLINE, REMINDERS_IN_BOT, REMINDER_INTERVAL, REMINDER_LEASE_RENEW, VIDEO_PAGE_SIZE, TELEGRAM_MESSAGE_LIMIT, TELEGRAM_WEBHOOK_URL, TELEGRAM_WEBHOOK_PORT, TELEGRAM_WEBHOOK_SECRET
+from src.calendar_tools import create_calendar_event, delete_calendar_event_by_summary, list_upcoming_events, find_free_slots, get_events_for_date, format_events_for_date, format_events_list, format_free_slots, truncate_lines
+from src.auth import get_user_creds, get_flow, save_user_creds
 from src.database.session import init_db
-from src.utils.context import current_user_id, current_user_creds
-from src.ui.calendar_keyboard import create_calendar, parse_callback_data
+from src.utils.context import current_user_id, current_user_creds, current_loop
+from src.ui.calendar_keyboard import create_calendar, create_events_navigation, parse_callback_data
+from src.calendar.paging import EventPager, remember_listing
+from src.ui.watchlist_keyboard import render_videos_page, parse_watch_callback
+from src.database.crud import add_videos, list_videos, set_video_status
+from src.watchlist.urls import normalize_urls
+from src.watchlist.titles import TitleWorker
+from src.digest.scheduler import run_digests, set_digest, get_digest_settings, parse_digest_time, format_digest_time, is_valid_timezone
+from src.utils.send_queue import SendQueue
+from src.calendar.sync import request_resync
+from src.calendar.store import get_calendar_state, events_on_date, busy_days, free_slots, get_tz
+from src.calendar.watch import NotificationReceiver, start_watch, renew_channels, poll_unwatched_users
+from src.reminders.leases import ShardLeaser, ensure_shards, new_worker_id
+from src.reminders.service import run_reminder_pass, prune_ledger
+from src.llm.scheduler import gemini_scheduler, RequestShed, INTERACTIVE, VOICE
+from src.utils.resilience import breaker_states, CircuitOpenError, DeadlineExceeded
+from src.state.backend import state_backend
 
 # Configure Gemini
 genai.configure(api_key=GEMINI_API_KEY)
-tools = [create_calendar_event, delete_calendar_event_by_summary, list_upcoming_events]
+tools = [create_calendar_event, delete_calendar_event_by_summary, list_upcoming_events, find_free_slots]
 model = genai.GenerativeModel(
     model_name='gemini-2.5-flash',
     tools=tools,
     system_instruction=(
         "You are Hope, a helpful Google Calendar Assistant. "
-        "Your ONLY purpose is to manage the user's calendar (add, delete, list events) "
+        "Your ONLY purpose is to manage the user's calendar (add, delete, list events, find free time) "
         "and answer questions strictly related to their schedule or time management. "
         "If a user asks about anything else (e.g. general knowledge, translation, coding, math), "
         "politely refuse and remind them that you can only help with the calendar."
     )
 )
-# Note: For multi-user, we likely want a new chat session per user or per request, 
-# but for simplicity we keep one global object for the *model*, 
-# and we will start a chat session locally if needed. 
-# Actually, `model.start_chat` returns a ChatSession which holds history.
-# We should probably persist history per user, but for now we'll just create a new chat 
-# or use a global one (which mixes history, bad for privacy).
-# STOPGAP: Cleanest is `model.generate_content(..., tools=...)` with history passed explicitly.
-# But `chat.send_message` manages history automatically.
-# Let's keep it simple: One global chat is FATAL for multi-user privacy.
-# We will use a dictionary `user_chats = {}`.
-
-user_chats = {}
+# One global chat would mix users' histories, so each user's history lives in the state
+# backend (shared between replicas) and a ChatSession is rebuilt from it for every message.
+# The backend's per-user lock keeps one message of a user in flight at a time, across all replicas.
+
+UNAVAILABLE_TEXT = "😔 Сервис сейчас перегружен или недоступен. Попробуй ещё раз через минуту."
+UNKNOWN_OUTCOME_TEXT = ("⚠️ Я не дождалась ответа, но изменения в календаре могли успеть примениться. "
+                        "Проверь календарь, прежде чем повторять запрос.")
+SHED_TEXT = "⏳ Сейчас очень много запросов, и я не успела ответить вовремя. Пожалуйста, повтори через минуту."
+
+async def send_to_gemini(user_id, priority, content):
+    """
+    Sends a message with the user's history through the Gemini scheduler (admission
+    control, retries, deadline) and stores the new turns. Call inside
+    gemini_scheduler.user_turn, which holds the user's lock.
+    """
+    history = await state_backend.load_history(user_id)
+    chat = model.start_chat(history=history, enable_automatic_function_calling=True)
+    response = await gemini_scheduler.submit(
+        user_id, priority, chat.send_message, content,
+        request_options={'timeout': GEMINI_REQUEST_TIMEOUT},
+        deadline=GEMINI_CALL_DEADLINE,
+    )
+    await state_backend.append_history(user_id, chat.history[len(history):])
+    return response
 
 async def start(update, context):
     user = update.effective_user
@@ -60,32 +91,43 @@ async def help_command(update, context):
         '/login — Авторизация в Google Calendar\n'
         '/events — Показать ближайшие события\n'
         '/calendar — Показать календарь\n'
+        '/free — Свободное время на сегодня (/free 2025-01-31 90 — на дату, от 90 минут)\n'
+        '/videos — Список «Смотреть позже»\n'
+        '/digest 08:00 — Утренний план на день (/digest off — выключить)\n'
         '/status — Проверить статус подключения\n'
         '/help — Показать это сообщение\n\n'
         '**Примеры запросов:**\n'
         '— "Запиши тренировку в четверг в 19:00 на 1.5 часа"\n'
         '— "Какие планы на завтра?"\n'
-        '— "Удали обед с коллегами"',
+        '— "Удали обед с коллегами"\n\n'
+        'Пришли ссылку (или сразу несколько) — сохраню в «Смотреть позже».',
         parse_mode='Markdown'
     )
 
+async def show_events_page(listing_id, pager, index):
+    """Returns (text, keyboard) for one page of an /events listing."""
+    index, events, has_next = await pager.get_page(index)
+    if not events and index == 0:
+        return "Нет предстоящих событий.", None
+    text = format_events_list(events, header=f"Предстоящие события (стр. {index + 1}):")
+    text = truncate_lines(text, TELEGRAM_MESSAGE_LIMIT)
+    return text, create_events_navigation(listing_id, index, has_next)
+
 async def events_command(update, context):
-    """Explicitly list upcoming events via command."""
+    """Explicitly list upcoming events via command, page by page."""
     user_id = update.effective_user.id
     creds = await get_user_creds(user_id)
     if not creds:
         await update.message.reply_text("Сначала нужно авторизоваться. Напиши /login")
         return
-    
-    # Store in context for the tool function
-    token_creds = current_user_creds.set(creds)
+
+    pager = EventPager(creds)
+    listing_id = remember_listing(context.user_data, pager)
     try:
-        events_text = list_upcoming_events(max_results=10)
-        await update.message.reply_text(events_text)
+        text, keyboard = await show_events_page(listing_id, pager, 0)
+        await update.message.reply_text(text, reply_markup=keyboard)
     except Exception as e:
         await update.message.reply_text(f"Ошибка получения событий: {e}")
-    finally:
-        current_user_creds.reset(token_creds)
 
 async def status_command(update, context):
     user_id = update.effective_user.id
@@ -98,6 +140,30 @@ async def status_command(update, context):
     else:
         await update.message.reply_text("❌ **Статус**: Не авторизован. Используйте /login.", parse_mode='Markdown')
 
+    # Dependency health (circuit breakers)
+    lines = []
+    for breaker in breaker_states():
+        if breaker["state"] == "closed":
+            lines.append(f"🟢 {breaker['name']}: работает")
+        elif breaker["state"] == "half_open":
+            lines.append(f"🟡 {breaker['name']}: проверяем восстановление")
+        else:
+            lines.append(f"🔴 {breaker['name']}: недоступен, повтор через {breaker['retry_in']:.0f} с")
+    load = gemini_scheduler.snapshot()
+    lines.append(f"🧠 gemini: лимит {load['limit']}, в работе {load['in_flight']}, в очереди {load['queued']}")
+    await update.message.reply_text("\n".join(lines))
+
+async def month_marks(user_id, year, month):
+    """Days of the month with events, from the local copy (empty until the first sync)."""
+    try:
+        timezone, synced = await get_calendar_state(user_id)
+        if not synced:
+            return set()
+        return await busy_days(user_id, year, month, timezone)
+    except Exception as e:
+        print(f"Error marking calendar days for {user_id}: {e}")
+        return set()
+
 async def calendar_command(update, context):
     """Show interactive calendar keyboard."""
     user_id = update.effective_user.id
@@ -106,9 +172,10 @@ async def calendar_command(update, context):
         await update.message.reply_text("⛔️ Сначала нужно авторизоваться. Напиши /login")
         return
     
+    today = date.today()
     await update.message.reply_text(
         "📅 Выберите дату:",
-        reply_markup=create_calendar()
+        reply_markup=create_calendar(marked_days=await month_marks(user_id, today.year, today.month))
     )
 
 async def calendar_callback(update, context):
@@ -135,20 +202,183 @@ async def calendar_callback(update, context):
         # Update the calendar view
         await query.edit_message_text(
             "📅 Выберите дату:",
-            reply_markup=create_calendar(year, month)
+            reply_markup=create_calendar(year, month, marked_days=await month_marks(user_id, year, month))
         )
         return
     
+    if action == "EVENTS":
+        listing_id = year
+        pager = context.user_data.get('events_listings', {}).get(listing_id)
+        if pager is None:
+            # Listing state is gone (old message, restart): start this message over
+            pager = EventPager(creds)
+            remember_listing(context.user_data, pager, listing_id)
+        try:
+            text, keyboard = await show_events_page(listing_id, pager, day)
+            await query.edit_message_text(text, reply_markup=keyboard)
+        except Exception as e:
+            await query.edit_message_text(f"Ошибка получения событий: {e}")
+        return
+
     if action == "DAY":
-        # Fetch events for that day
+        target_date = date(year, month, day)
+        timezone, synced = await get_calendar_state(user_id)
+        if synced:
+            # Local copy, recurring series expanded locally
+            events = await events_on_date(user_id, target_date, timezone)
+            await query.edit_message_text(format_events_for_date(target_date, events))
+            return
+
+        # Not synced yet: ask Google directly
         token_creds = current_user_creds.set(creds)
         try:
-            target_date = date(year, month, day)
-            events_text = get_events_for_date(target_date)
+            # Blocking (retries sleep up to GOOGLE_CALL_DEADLINE): keep it off the event loop
+            events_text = await asyncio.to_thread(get_events_for_date, target_date)
             await query.edit_message_text(events_text)
         finally:
             current_user_creds.reset(token_creds)
 
+async def free_command(update, context):
+    """/free [YYYY-MM-DD] [minutes] - free time within working hours."""
+    user_id = update.effective_user.id
+    creds = await get_user_creds(user_id)
+    if not creds:
+        await update.message.reply_text("⛔️ Сначала нужно авторизоваться. Напиши /login")
+        return
+
+    timezone, synced = await get_calendar_state(user_id)
+    if not synced:
+        request_resync(user_id)
+        await update.message.reply_text("⏳ Календарь ещё синхронизируется, попробуй через минуту.")
+        return
+
+    args = context.args or []
+    try:
+        if args and "-" in args[0]:
+            target_date = date.fromisoformat(args.pop(0))
+        else:
+            target_date = datetime.datetime.now(get_tz(timezone)).date()
+        duration = int(args[0]) if args else 60
+    except ValueError:
+        await update.message.reply_text("Не понимаю. Пример: /free 2025-01-31 90")
+        return
+
+    slots = await free_slots(user_id, target_date, timezone, duration)
+    await update.message.reply_text(format_free_slots(target_date, slots))
+
+async def videos_command(update, context):
+    """Show the first page of the watch-later list."""
+    user_id = update.effective_user.id
+    videos, has_older = await list_videos(user_id, limit=VIDEO_PAGE_SIZE)
+    text, keyboard = render_videos_page(videos, has_older=has_older, has_newer=False)
+    await update.message.reply_text(text, reply_markup=keyboard, disable_web_page_preview=True)
+
+async def watchlist_callback(update, context):
+    """Handle watch-later list paging and 'watched' buttons."""
+    query = update.callback_query
+    await query.answer()
+
+    user_id = update.effective_user.id
+    data = parse_watch_callback(query.data)
+    action = data["action"]
+    cursor = data["cursor"]
+
+    if action == "IGNORE":
+        return
+
+    if action == "DONE":
+        await set_video_status(user_id, data["video_id"], "watched")
+        videos, has_older = await list_videos(user_id, cursor=cursor, direction="at", limit=VIDEO_PAGE_SIZE)
+        # Existence check only: limit=0 fetches at most one row
+        _, has_newer = await list_videos(user_id, cursor=cursor, direction="prev", limit=0)
+    elif action == "PREV":
+        videos, has_newer = await list_videos(user_id, cursor=cursor, direction="prev", limit=VIDEO_PAGE_SIZE)
+        has_older = True
+    else:
+        videos, has_older = await list_videos(user_id, cursor=cursor, direction="next", limit=VIDEO_PAGE_SIZE)
+        has_newer = True
+
+    if not videos:
+        # Page emptied (e.g. everything on it was watched) - fall back to the first page
+        videos, has_older = await list_videos(user_id, limit=VIDEO_PAGE_SIZE)
+        has_newer = False
+
+    text, keyboard = render_videos_page(videos, has_older=has_older, has_newer=has_newer)
+    await query.edit_message_text(text, reply_markup=keyboard, disable_web_page_preview=True)
+
+async def save_links(update, context) -> bool:
+    """
+    Saves the message's links to the watch-later list if the message consists of links only.
+    Returns True when the message was handled this way.
+    """
+    message = update.message
+    entities = message.parse_entities([MessageEntity.URL, MessageEntity.TEXT_LINK])
+    if not entities:
+        return False
+
+    rest = message.text
+    for text in entities.values():
+        rest = rest.replace(text, " ")
+    if rest.strip(string.whitespace + string.punctuation + "•—«»"):
+        # Links inside a normal request (e.g. a meeting link) go to the assistant
+        return False
+
+    urls = normalize_urls(
+        entity.url if entity.type == MessageEntity.TEXT_LINK else text
+        for entity, text in entities.items()
+    )
+    user_id = update.effective_user.id
+    if not await get_user_creds(user_id):
+        await message.reply_text("⛔️ Сначала нужно авторизоваться. Напиши /login")
+        return True
+
+    added = await add_videos(user_id, urls)
+    context.application.bot_data['title_worker'].notify()
+
+    reply = f"🎬 Добавлено в «Смотреть позже»: {added}"
+    if added < len(urls):
+        reply += f" (уже в списке: {len(urls) - added})"
+    await message.reply_text(reply + "\n/videos — открыть список")
+    return True
+
+async def digest_command(update, context):
+    """/digest [HH:MM [Timezone]] | /digest off"""
+    user_id = update.effective_user.id
+    args = context.args or []
+
+    if not args:
+        minute, timezone = await get_digest_settings(user_id)
+        if minute is None:
+            await update.message.reply_text(
+                "☀️ Утренний план выключен.\n"
+                "Включить: /digest 08:00 (можно указать часовой пояс: /digest 08:00 Europe/Moscow)"
+            )
+        else:
+            await update.message.reply_text(
+                f"☀️ Утренний план приходит в {format_digest_time(minute)} ({timezone}).\n"
+                "Выключить: /digest off"
+            )
+        return
+
+    if args[0].lower() == "off":
+        await set_digest(user_id, None)
+        await update.message.reply_text("☀️ Утренний план выключен.")
+        return
+
+    minute = parse_digest_time(args[0])
+    if minute is None:
+        await update.message.reply_text("Не понимаю время. Пример: /digest 08:00")
+        return
+
+    timezone = args[1] if len(args) > 1 else None
+    if timezone and not is_valid_timezone(timezone):
+        await update.message.reply_text("Неизвестный часовой пояс. Пример: Europe/Moscow")
+        return
+
+    await set_digest(user_id, minute, timezone)
+    _, timezone = await get_digest_settings(user_id)
+    await update.message.reply_text(f"✅ Буду присылать план на день в {format_digest_time(minute)} ({timezone}).")
+
 async def login(update, context):
     user_id = update.effective_user.id
     flow = get_flow()
@@ -172,6 +402,10 @@ async def handle_message(update, context):
             flow.fetch_token(code=user_text.strip())
             creds = flow.credentials
             await save_user_creds(user_id, creds)
+            # Initial sync now; push channel (if enabled) keeps it fresh afterwards
+            request_resync(user_id)
+            if WATCH_WEBHOOK_URL:
+                context.application.create_task(start_watch(user_id))
             await update.message.reply_text("Отлично! Ты успешно авторизован. Теперь можешь просить меня записать что-то в календарь.")
             return
         except Exception as e:
@@ -179,6 +413,9 @@ async def handle_message(update, context):
             await update.message.reply_text(f"❌ Не удалось авторизоваться. Ошибка: {str(e)}")
             return
 
+    if await save_links(update, context):
+        return
+
     # Normal message handling
     await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=telegram.constants.ChatAction.TYPING)
 
@@ -191,20 +428,21 @@ async def handle_message(update, context):
     # Set context vars
     token_id = current_user_id.set(user_id)
     token_creds = current_user_creds.set(creds)
+    token_loop = current_loop.set(asyncio.get_running_loop())
 
     try:
-        # 2. Get or create ChatSession
-        if user_id not in user_chats:
-            user_chats[user_id] = model.start_chat(enable_automatic_function_calling=True)
-        
-        chat = user_chats[user_id]
-        
-        current_date = datetime.date.today().isoformat()
-        augmented_user_text = f"Today's date is {current_date}. User request: {user_text}"
-        
-        response = chat.send_message(augmented_user_text)
+        async with gemini_scheduler.user_turn(user_id, INTERACTIVE, state_backend.user_lock(user_id)):
+            current_date = datetime.date.today().isoformat()
+            augmented_user_text = f"Today's date is {current_date}. User request: {user_text}"
+
+            response = await send_to_gemini(user_id, INTERACTIVE, augmented_user_text)
         await update.message.reply_text(response.text)
 
+    except RequestShed:
+        await update.message.reply_text(SHED_TEXT)
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        print(f"Gemini unavailable: {e}")
+        await update.message.reply_text(UNKNOWN_OUTCOME_TEXT if getattr(e, 'outcome_unknown', False) else UNAVAILABLE_TEXT)
     except Exception as e:
         print(f"Ошибка: {e}")
         await update.message.reply_text("Ой, что-то пошло не так.")
@@ -212,6 +450,7 @@ async def handle_message(update, context):
         # Reset context (for safety, though usually not strictly needed in async handlers if they don't leak)
         current_user_id.reset(token_id)
         current_user_creds.reset(token_creds)
+        current_loop.reset(token_loop)
 
 async def handle_voice_message(update, context):
     """Handle voice messages by transcribing with Gemini and processing as text."""
@@ -245,121 +484,134 @@ async def handle_voice_message(update, context):
         
         try:
             # Upload file to Gemini
-            audio_file = genai.upload_file(tmp_path, mime_type="audio/ogg")
+            audio_file = await gemini_scheduler.submit(
+                user_id, VOICE, genai.upload_file, tmp_path, mime_type="audio/ogg",
+            )
             
             # Set context vars
             token_id = current_user_id.set(user_id)
             token_creds = current_user_creds.set(creds)
+            token_loop = current_loop.set(asyncio.get_running_loop())
             
             try:
-                # Get or create ChatSession
-                if user_id not in user_chats:
-                    user_chats[user_id] = model.start_chat(enable_automatic_function_calling=True)
-                
-                chat = user_chats[user_id]
-                
-                current_date_str = datetime.date.today().isoformat()
-                prompt = f"Today's date is {current_date_str}. The user sent a voice message. First transcribe it, then process the request."
-                
-                response = chat.send_message([audio_file, prompt])
+                async with gemini_scheduler.user_turn(user_id, VOICE, state_backend.user_lock(user_id)):
+                    current_date_str = datetime.date.today().isoformat()
+                    prompt = f"Today's date is {current_date_str}. The user sent a voice message. First transcribe it, then process the request."
+
+                    response = await send_to_gemini(user_id, VOICE, [audio_file, prompt])
                 await update.message.reply_text(response.text)
                 
             finally:
                 current_user_id.reset(token_id)
                 current_user_creds.reset(token_creds)
+                current_loop.reset(token_loop)
         finally:
             # Clean up temp file
             os.unlink(tmp_path)
             
+    except RequestShed:
+        await update.message.reply_text(SHED_TEXT)
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        print(f"Gemini unavailable: {e}")
+        await update.message.reply_text(UNKNOWN_OUTCOME_TEXT if getattr(e, 'outcome_unknown', False) else UNAVAILABLE_TEXT)
     except Exception as e:
         print(f"Ошибка обработки голосового: {e}")
         await update.message.reply_text(f"Ой, не удалось обработать голосовое сообщение. Ошибка: {e}")
 
-sent_reminders = set()
+# Reminders: the bot takes part in shard leasing like any reminder_worker.py process,
+# so it can run alone or next to dedicated workers without double-sending.
+reminder_leaser = ShardLeaser(new_worker_id("bot"))
+
+async def renew_reminder_leases(context):
+    """Job to renew this process's reminder shard leases."""
+    try:
+        await reminder_leaser.refresh()
+    except Exception as e:
+        print(f"Error in renew_reminder_leases job: {e}")
 
 async def check_reminders(context):
-    """Job to check for upcoming events and send reminders for ALL users."""
+    """Job to check for upcoming events and send reminders for users in our shards."""
     try:
-        users = await get_all_authenticated_users()
-        
-        for user in users:
-            user_id = user.telegram_id
-            
-            # Load creds for this user
-            creds = await get_user_creds(user_id)
-            if not creds:
-                 continue
+        await run_reminder_pass(context.bot, reminder_leaser)
+        await prune_ledger()
+    except Exception as e:
+        print(f"Error in check_reminders job: {e}")
 
-            # Set context
-            token_creds = current_user_creds.set(creds)
-            
-            try:
-                # Check events starting in the next 30 minutes
-                events = get_upcoming_events_soon(minutes=30)
-                
-                if events:
-                     for event in events:
-                        event_id = event['id']
-                        
-                        # Skip if already sent
-                        if event_id in sent_reminders:
-                            continue
-                            
-                        summary = event.get('summary', 'Без названия')
-                        start = event['start']
-                        end = event['end']
-                        
-                        # Handle formatting and time check
-                        start_str = start.get('dateTime', start.get('date'))
-                        end_str = end.get('dateTime', end.get('date'))
-                        
-                        msg = ""
-                        
-                        if 'dateTime' in start:
-                            # Parse times
-                            start_dt = datetime.datetime.fromisoformat(start_str)
-                            end_dt = datetime.datetime.fromisoformat(end_str)
-                            
-                            # Check if it's too close to start (e.g. user said "not right now")
-                            # We'll rely primarily on the duplicate check, but we could also check time
-                            # Current logic: If we catch it in the [0, 30] min window and haven't sent it, we send.
-                            
-                            # Format: "Название активности: время(например 16:00 - 17:00"
-                            time_range = f"{start_dt.strftime('%H:%M')} - {end_dt.strftime('%H:%M')}"
-                            msg = f"⏰ Напоминание! Скоро: {summary}: {time_range}"
-                        else:
-                            # All-day event
-                            msg = f"⏰ Напоминание! Сегодня: {summary}"
-
-                        try:
-                             await context.bot.send_message(chat_id=user_id, text=msg)
-                             # Mark as sent
-                             sent_reminders.add(event_id)
-                        except Exception as inner_e:
-                            print(f"Failed to send message to {user_id}: {inner_e}")
+async def send_digests(context):
+    """Job to queue morning digests of users whose delivery minute has come."""
+    try:
+        await run_digests(context.application.bot_data['send_queue'])
+    except Exception as e:
+        print(f"Error in send_digests job: {e}")
 
-            finally:
-                current_user_creds.reset(token_creds)
-                
+async def renew_watch_channels(context):
+    """Job to keep a live push channel for every user."""
+    try:
+        # One replica per run, or each would open its own channels
+        if await state_backend.try_acquire("renew_watch_channels", ttl=600):
+            await renew_channels()
     except Exception as e:
-        print(f"Error in check_reminders job: {e}")
+        print(f"Error in renew_watch_channels job: {e}")
+
+async def sync_fallback(context):
+    """Job to poll calendars of users without a live push channel."""
+    try:
+        if await state_backend.try_acquire("sync_fallback", ttl=50):
+            await poll_unwatched_users()
+    except Exception as e:
+        print(f"Error in sync_fallback job: {e}")
 
 async def post_init(application):
     await init_db()
+    await ensure_shards()
+    await state_backend.start()
+
+    send_queue = SendQueue(application.bot)
+    send_queue.start()
+    application.bot_data['send_queue'] = send_queue
+
+    title_worker = TitleWorker()
+    title_worker.start()
+    application.bot_data['title_worker'] = title_worker
+
+    if WATCH_WEBHOOK_URL:
+        receiver = NotificationReceiver(WATCH_RECEIVER_HOST, WATCH_RECEIVER_PORT)
+        await receiver.start()
+        application.bot_data['watch_receiver'] = receiver
     
     # Set bot commands for the menu button
     await application.bot.set_my_commands([
         ('start', 'Запустить бота'),
         ('calendar', '📅 Календарь'),
         ('events', 'Ближайшие события'),
+        ('videos', '🎬 Смотреть позже'),
+        ('digest', '☀️ Утренний план'),
         ('status', 'Статус подключения'),
         ('login', 'Авторизация в Google'),
         ('help', 'Справка'),
     ])
 
+async def post_shutdown(application):
+    if REMINDERS_IN_BOT:
+        await reminder_leaser.release()
+
+    send_queue = application.bot_data.get('send_queue')
+    if send_queue:
+        await send_queue.stop()
+
+    title_worker = application.bot_data.get('title_worker')
+    if title_worker:
+        await title_worker.stop()
+
+    receiver = application.bot_data.get('watch_receiver')
+    if receiver:
+        await receiver.stop()
+
+    await state_backend.stop()
+
 def run_bot():
     print("Бот (с Календарем) запускается...")
-    application = Application.builder().token(TELEGRAM_TOKEN).post_init(post_init).build()
+    application = Application.builder().token(TELEGRAM_TOKEN).post_init(post_init).post_shutdown(post_shutdown).concurrent_updates(True).build()
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("login", login))
@@ -367,15 +619,36 @@ def run_bot():
     application.add_handler(CommandHandler("events", events_command))
     application.add_handler(CommandHandler("status", status_command))
     application.add_handler(CommandHandler("calendar", calendar_command))
+    application.add_handler(CommandHandler("free", free_command))
+    application.add_handler(CommandHandler("videos", videos_command))
+    application.add_handler(CommandHandler("digest", digest_command))
     
     # Callback handler for calendar navigation
     application.add_handler(CallbackQueryHandler(calendar_callback, pattern=r"^CALENDAR\|"))
+    application.add_handler(CallbackQueryHandler(watchlist_callback, pattern=r"^WATCH\|"))
     
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_handler(MessageHandler(filters.VOICE, handle_voice_message))
     
     if application.job_queue:
-        # Check every minute
-        application.job_queue.run_repeating(check_reminders, interval=60, first=10)
+        if REMINDERS_IN_BOT:
+            application.job_queue.run_repeating(renew_reminder_leases, interval=REMINDER_LEASE_RENEW, first=1)
+            application.job_queue.run_repeating(check_reminders, interval=REMINDER_INTERVAL, first=10)
+        # Digests: at the start of every minute
+        application.job_queue.run_repeating(send_digests, interval=60, first=60 - datetime.datetime.now().second)
+        # Local event copy: push channels when configured, polling as the fallback
+        if WATCH_WEBHOOK_URL:
+            application.job_queue.run_repeating(renew_watch_channels, interval=3600, first=30)
+        application.job_queue.run_repeating(sync_fallback, interval=60, first=60)
 
-    application.run_polling()
+    if TELEGRAM_WEBHOOK_URL:
+        # Several replicas can share the token only this way (getUpdates allows one consumer)
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=TELEGRAM_WEBHOOK_PORT,
+            url_path=urlsplit(TELEGRAM_WEBHOOK_URL).path.lstrip("/"),
+            webhook_url=TELEGRAM_WEBHOOK_URL,
+            secret_token=TELEGRAM_WEBHOOK_SECRET,
+        )
+    else:
+        application.run_polling()
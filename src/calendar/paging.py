@@ -0,0 +1,85 @@
+# src/calendar/paging.py
+import asyncio
+import datetime
+import time
+
+from src.config import EVENTS_PAGE_SIZE
+from src.calendar_tools import fetch_events_page
+from src.utils.context import current_user_creds
+
+MAX_CACHED_PAGES = 20
+MAX_LISTINGS = 5        # /events listings per user whose buttons keep working
+
+def _fetch_blocking(creds, time_min: str, page_token: str | None):
+    token_creds = current_user_creds.set(creds)
+    try:
+        return fetch_events_page(time_min, page_token, page_size=EVENTS_PAGE_SIZE)
+    finally:
+        current_user_creds.reset(token_creds)
+
+
+class EventPager:
+    """
+    Paging state of one /events listing.
+    Google only gives a token for the *next* page, so tokens of visited pages are kept
+    to be able to go back. Whenever a page is shown, the following one is already
+    being fetched in the background, so "Далее" is usually answered from memory.
+    """
+
+    def __init__(self, creds):
+        self.creds = creds
+        # Frozen for the whole listing: page tokens are only valid for identical queries
+        self.time_min = datetime.datetime.utcnow().isoformat() + 'Z'
+        self.tokens = [None]        # tokens[i] is the pageToken of page i
+        self._pages = {}            # page index -> Task returning (events, next_token)
+
+    def _fetch(self, index: int) -> asyncio.Task:
+        task = self._pages.get(index)
+        if task is None or (task.done() and task.exception() is not None):
+            task = asyncio.create_task(
+                asyncio.to_thread(_fetch_blocking, self.creds, self.time_min, self.tokens[index])
+            )
+            # A failed prefetch is simply retried on demand; don't log it as unhandled
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._pages[index] = task
+            # Forget pages far from the current one; they can be refetched by token
+            for old in [i for i in self._pages if abs(i - index) > MAX_CACHED_PAGES]:
+                self._pages.pop(old).cancel()
+        return task
+
+    async def get_page(self, index: int):
+        """
+        Returns (index, events, has_next) for page `index` (clamped to pages we can reach)
+        and starts prefetching the next one.
+        """
+        index = min(index, len(self.tokens) - 1)
+        events, next_token = await self._fetch(index)
+
+        if next_token:
+            if len(self.tokens) == index + 1:
+                self.tokens.append(next_token)
+            self._fetch(index + 1)
+        return index, events, next_token is not None
+
+    def close(self):
+        """Stops pending prefetches of a listing that is no longer kept."""
+        for task in self._pages.values():
+            task.cancel()
+        self._pages.clear()
+
+
+def remember_listing(user_data: dict, pager: EventPager, listing_id: int = None) -> int:
+    """
+    Stores a pager under its listing id (a new one unless given), so the buttons of
+    every recent /events message page through their own listing. Returns the id.
+    New ids are increasing millisecond timestamps, so they don't repeat the ids of
+    messages sent before a restart.
+    """
+    listings = user_data.setdefault('events_listings', {})
+    if listing_id is None:
+        listing_id = max(int(time.time() * 1000), user_data.get('events_listing_seq', 0) + 1)
+        user_data['events_listing_seq'] = listing_id
+    listings[listing_id] = pager
+    while len(listings) > MAX_LISTINGS:
+        listings.pop(min(listings)).close()
+    return listing_id
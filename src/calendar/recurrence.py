@@ -0,0 +1,170 @@
+# src/calendar/recurrence.py
+import datetime
+import re
+from dateutil import tz
+from dateutil.rrule import rrulestr, rruleset
+
+# Local expansion of recurring events.
+# Google stores a recurring series as one "master" event with RFC 5545 lines in
+# `recurrence` (RRULE/RDATE/EXDATE) plus separate exception events (moved, edited or
+# cancelled instances, linked by recurringEventId + originalStartTime). We keep exactly
+# that and generate instances on demand, lazily, for whatever window is asked for.
+# Generated instances look like Google's singleEvents=True output (same ids too).
+
+UNTIL_RE = re.compile(r"UNTIL=(\d{8})(T(\d{6})(Z?))?", re.IGNORECASE)
+BOUNDED_RE = re.compile(r"[:;](COUNT|UNTIL)=", re.IGNORECASE)
+
+def _tzinfo(name: str | None):
+    return (tz.gettz(name) if name else None) or tz.UTC
+
+def _event_tz(event: dict):
+    return _tzinfo(event['start'].get('timeZone'))
+
+def _parse_bound(bound: dict, event_tz):
+    """Google start/end -> aware datetime in the event's timezone, or date for all-day."""
+    if 'dateTime' in bound:
+        return datetime.datetime.fromisoformat(bound['dateTime']).astimezone(event_tz)
+    return datetime.date.fromisoformat(bound['date'])
+
+def _normalize_rrule(line: str, event_tz, all_day: bool) -> str:
+    """dateutil wants UNTIL in UTC for aware starts and naive for all-day starts."""
+    def fix(match):
+        day, clock, utc = match.group(1), match.group(3), match.group(4)
+        if all_day:
+            return f"UNTIL={day}T{clock or '235959'}"
+        if utc:
+            return match.group(0)
+        local = datetime.datetime.strptime(day + (clock or "235959"), "%Y%m%d%H%M%S").replace(tzinfo=event_tz)
+        return "UNTIL=" + local.astimezone(tz.UTC).strftime("%Y%m%dT%H%M%SZ")
+    return UNTIL_RE.sub(fix, line)
+
+def _parse_date_list(line: str, event_tz, all_day: bool) -> list:
+    """Values of an RDATE/EXDATE line (TZID, UTC, floating and VALUE=DATE forms)."""
+    head, _, values = line.partition(":")
+    params = dict(p.split("=", 1) for p in head.split(";")[1:] if "=" in p)
+    value_tz = _tzinfo(params['TZID']) if 'TZID' in params else event_tz
+    result = []
+    for value in values.split(","):
+        value = value.strip()
+        if not value:
+            continue
+        if len(value) == 8:
+            moment = datetime.datetime.strptime(value, "%Y%m%d")
+        elif value.endswith("Z"):
+            moment = datetime.datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=tz.UTC)
+        else:
+            moment = datetime.datetime.strptime(value, "%Y%m%dT%H%M%S").replace(tzinfo=value_tz)
+
+        if all_day:
+            result.append(datetime.datetime.combine(moment.date(), datetime.time.min))
+        else:
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=value_tz)
+            result.append(moment.astimezone(event_tz))
+    return result
+
+def build_ruleset(master: dict) -> rruleset:
+    """rruleset of a master's occurrence starts (aware in its timezone, or naive midnights for all-day)."""
+    event_tz = _event_tz(master)
+    start = _parse_bound(master['start'], event_tz)
+    all_day = not isinstance(start, datetime.datetime)
+    dtstart = datetime.datetime.combine(start, datetime.time.min) if all_day else start
+
+    rules = rruleset()
+    for line in master.get('recurrence', []):
+        kind = line.split(":", 1)[0].split(";", 1)[0].upper()
+        if kind == "RRULE":
+            rules.rrule(rrulestr(_normalize_rrule(line, event_tz, all_day), dtstart=dtstart))
+        elif kind == "RDATE":
+            for moment in _parse_date_list(line, event_tz, all_day):
+                rules.rdate(moment)
+        elif kind == "EXDATE":
+            for moment in _parse_date_list(line, event_tz, all_day):
+                rules.exdate(moment)
+    # DTSTART itself is always the first instance
+    rules.rdate(dtstart)
+    return rules
+
+def series_end(master: dict) -> datetime.datetime | None:
+    """Naive UTC end of the last instance, or None for a series without end."""
+    for line in master.get('recurrence', []):
+        kind = line.split(":", 1)[0].split(";", 1)[0].upper()
+        if kind == "RRULE" and not BOUNDED_RE.search(line):
+            return None
+    rules = build_ruleset(master)
+    all_day = not isinstance(_parse_bound(master['start'], _event_tz(master)), datetime.datetime)
+    last = rules.before(datetime.datetime.max if all_day else datetime.datetime.max.replace(tzinfo=tz.UTC), inc=True)
+    if last is None:
+        return None
+    return _to_utc_naive(last) + _duration(master)
+
+def _duration(master: dict) -> datetime.timedelta:
+    event_tz = _event_tz(master)
+    start = _parse_bound(master['start'], event_tz)
+    end = _parse_bound(master['end'], event_tz)
+    return end - start
+
+def _to_utc_naive(moment: datetime.datetime) -> datetime.datetime:
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(tz.UTC).replace(tzinfo=None)
+
+def original_start_key(event: dict) -> str:
+    """Identity of an instance within its series: UTC timestamp, or the date for all-day."""
+    original = event.get('originalStartTime') or event['start']
+    if 'dateTime' in original:
+        moment = datetime.datetime.fromisoformat(original['dateTime']).astimezone(tz.UTC)
+        return moment.strftime("%Y%m%dT%H%M%SZ")
+    return original['date'].replace("-", "")
+
+def _instance(master: dict, start, duration: datetime.timedelta, all_day: bool, event_tz) -> dict:
+    instance = {key: value for key, value in master.items() if key != 'recurrence'}
+    if all_day:
+        day = start.date()
+        start_bound = {'date': day.isoformat()}
+        end_bound = {'date': (day + duration).isoformat()}
+        key = day.strftime("%Y%m%d")
+    else:
+        # Wall-clock arithmetic keeps e.g. 09:00-10:00 across DST changes
+        end = (start.replace(tzinfo=None) + duration).replace(tzinfo=start.tzinfo)
+        start_bound = {'dateTime': start.isoformat(), 'timeZone': master['start'].get('timeZone')}
+        end_bound = {'dateTime': end.isoformat(), 'timeZone': master['end'].get('timeZone')}
+        key = start.astimezone(tz.UTC).strftime("%Y%m%dT%H%M%SZ")
+
+    instance['id'] = f"{master['id']}_{key}"
+    instance['recurringEventId'] = master['id']
+    instance['originalStartTime'] = dict(start_bound)
+    instance['start'] = start_bound
+    instance['end'] = end_bound
+    return instance
+
+def expand(master: dict, window_start: datetime.datetime, window_end: datetime.datetime, overridden=frozenset()):
+    """
+    Lazily yields instances of a recurring master overlapping [window_start, window_end)
+    (naive UTC; all-day instances are compared by their naive midnights, as in the event
+    copy), in start order. Instances whose key is in `overridden` are skipped - their
+    exception event replaces them.
+    """
+    event_tz = _event_tz(master)
+    duration = _duration(master)
+    all_day = not isinstance(_parse_bound(master['start'], event_tz), datetime.datetime)
+    rules = build_ruleset(master)
+
+    # Start early enough to catch an instance that began before the window and still runs
+    if all_day:
+        search_from = window_start - datetime.timedelta(days=duration.days or 1)
+        span = datetime.timedelta(days=duration.days)
+    else:
+        search_from = (window_start - duration).replace(tzinfo=tz.UTC).astimezone(event_tz)
+        span = duration
+
+    for start in rules.xafter(search_from, inc=True):
+        start_utc = _to_utc_naive(start)
+        if start_utc >= window_end:
+            return
+        if start_utc + span <= window_start:
+            continue
+        instance = _instance(master, start, duration, all_day, event_tz)
+        if original_start_key(instance) in overridden:
+            continue
+        yield instance
@@ -0,0 +1,205 @@
+# src/calendar/store.py
+import datetime
+import heapq
+import json
+import pytz
+from sqlalchemy import select, or_, and_
+
+from src.config import DEFAULT_TIMEZONE, WORK_DAY_START, WORK_DAY_END
+from src.calendar.recurrence import expand, original_start_key
+from src.calendar.sync import parse_event_bound
+from src.database.session import async_session_maker
+from src.database.models import User, CalendarEvent
+
+# Reads of the local event copy. Windows are naive UTC, like the stored columns.
+
+# How far an exception may have been moved from the instance it replaces and still be
+# loaded for a window containing that instance
+EXCEPTION_MOVE_MARGIN = datetime.timedelta(days=7)
+
+async def load_rows(user_ids, window_start: datetime.datetime, window_end: datetime.datetime) -> dict:
+    """
+    One query for everything needed to list events of many users in a window:
+    single events overlapping it, recurring masters whose series overlaps it, and
+    exceptions that either fall into it or replace an instance that would.
+    Returns {user_id: [CalendarEvent, ...]}.
+    """
+    by_user = {user_id: [] for user_id in user_ids}
+    if not by_user:
+        return by_user
+
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(CalendarEvent).where(
+                CalendarEvent.user_id.in_(list(by_user)),
+                or_(
+                    and_(CalendarEvent.start_at < window_end, CalendarEvent.end_at > window_start),
+                    and_(
+                        CalendarEvent.recurrence.is_not(None),
+                        CalendarEvent.start_at < window_end,
+                        or_(CalendarEvent.series_end.is_(None), CalendarEvent.series_end > window_start),
+                    ),
+                    and_(
+                        CalendarEvent.recurring_event_id.is_not(None),
+                        CalendarEvent.original_start_at < window_end + EXCEPTION_MOVE_MARGIN,
+                        CalendarEvent.original_start_at > window_start - EXCEPTION_MOVE_MARGIN,
+                    ),
+                ),
+            )
+        )
+        for row in result.scalars().all():
+            by_user[row.user_id].append(row)
+    return by_user
+
+def _start_key(event: dict) -> datetime.datetime:
+    return parse_event_bound(event['start'])[0]
+
+def _overlaps(event: dict, window_start: datetime.datetime, window_end: datetime.datetime) -> bool:
+    start_at, _ = parse_event_bound(event['start'])
+    end_at, _ = parse_event_bound(event['end'])
+    return start_at < window_end and end_at > window_start
+
+def iter_events(rows, window_start: datetime.datetime, window_end: datetime.datetime):
+    """
+    Lazily yields the user's events overlapping the window in start order, as Google
+    event dicts - recurring series are expanded on the fly, one instance at a time,
+    so memory doesn't grow with the length of the window.
+    """
+    singles = []
+    masters = []
+    exceptions = {}     # master id -> [exception events]
+    for row in rows:
+        event = json.loads(row.payload)
+        if row.recurrence:
+            masters.append(event)
+        elif row.recurring_event_id:
+            exceptions.setdefault(row.recurring_event_id, []).append(event)
+        elif row.status != 'cancelled':
+            singles.append(event)
+
+    streams = [sorted((e for e in singles if _overlaps(e, window_start, window_end)), key=_start_key)]
+    for master in masters:
+        replaced = exceptions.pop(master['id'], [])
+        overridden = frozenset(original_start_key(e) for e in replaced)
+        streams.append(expand(master, window_start, window_end, overridden))
+        streams.append(sorted(
+            (e for e in replaced if e.get('status') != 'cancelled' and _overlaps(e, window_start, window_end)),
+            key=_start_key,
+        ))
+    # Exceptions whose master we don't have (e.g. instance of someone else's series)
+    for orphans in exceptions.values():
+        streams.append(sorted(
+            (e for e in orphans if e.get('status') != 'cancelled' and _overlaps(e, window_start, window_end)),
+            key=_start_key,
+        ))
+
+    return heapq.merge(*streams, key=_start_key)
+
+async def events_between(user_id: int, window_start: datetime.datetime, window_end: datetime.datetime):
+    """Convenience for a single user: generator over the window."""
+    rows = await load_rows([user_id], window_start, window_end)
+    return iter_events(rows[user_id], window_start, window_end)
+
+def local_day_window(local_date: datetime.date, timezone: str):
+    """Local midnight to next local midnight as naive UTC (23/25 hours on DST days)."""
+    tz = get_tz(timezone)
+    day_start = tz.localize(datetime.datetime.combine(local_date, datetime.time.min))
+    day_end = tz.localize(datetime.datetime.combine(local_date + datetime.timedelta(days=1), datetime.time.min))
+    return (day_start.astimezone(pytz.utc).replace(tzinfo=None),
+            day_end.astimezone(pytz.utc).replace(tzinfo=None))
+
+def occurs_on(event: dict, local_date: datetime.date, day_start: datetime.datetime, day_end: datetime.datetime) -> bool:
+    start_at, all_day = parse_event_bound(event['start'])
+    end_at, _ = parse_event_bound(event['end'])
+    if all_day:
+        # All-day events span [start date, end date) in calendar dates
+        return start_at.date() <= local_date < end_at.date()
+    return start_at < day_end and end_at > day_start
+
+def _padded_window(day_start: datetime.datetime, day_end: datetime.datetime):
+    # All-day rows are stored as naive midnights, which may sit outside the UTC window
+    return day_start - datetime.timedelta(days=1), day_end + datetime.timedelta(days=1)
+
+def get_tz(timezone: str | None):
+    try:
+        return pytz.timezone(timezone or DEFAULT_TIMEZONE)
+    except pytz.UnknownTimeZoneError:
+        return pytz.timezone(DEFAULT_TIMEZONE)
+
+async def get_calendar_state(user_id: int):
+    """Returns (timezone, synced) - whether the local copy can answer for this user."""
+    async with async_session_maker() as session:
+        user = await session.get(User, user_id)
+    if not user:
+        return DEFAULT_TIMEZONE, False
+    return user.timezone or DEFAULT_TIMEZONE, user.last_synced_at is not None
+
+async def events_on_date(user_id: int, local_date: datetime.date, timezone: str) -> list[dict]:
+    day_start, day_end = local_day_window(local_date, timezone)
+    events = await events_between(user_id, *_padded_window(day_start, day_end))
+    return [event for event in events if occurs_on(event, local_date, day_start, day_end)]
+
+async def busy_days(user_id: int, year: int, month: int, timezone: str) -> set[int]:
+    """Days of the month that have at least one event (for marks in the month view)."""
+    first = datetime.date(year, month, 1)
+    last = (first + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+    month_start, _ = local_day_window(first, timezone)
+    _, month_end = local_day_window(last, timezone)
+    tz = get_tz(timezone)
+
+    days = set()
+    for event in await events_between(user_id, *_padded_window(month_start, month_end)):
+        start_at, all_day = parse_event_bound(event['start'])
+        end_at, _ = parse_event_bound(event['end'])
+        if all_day:
+            day = max(start_at.date(), first)
+            while day < end_at.date() and day <= last:
+                days.add(day.day)
+                day += datetime.timedelta(days=1)
+        else:
+            local_start = pytz.utc.localize(start_at).astimezone(tz).date()
+            if first <= local_start <= last:
+                days.add(local_start.day)
+    return days
+
+def work_day_window(local_date: datetime.date, timezone: str):
+    """Working hours of a local day as naive UTC."""
+    tz = get_tz(timezone)
+    work_start = tz.localize(datetime.datetime.combine(local_date, datetime.time(WORK_DAY_START)))
+    work_end = tz.localize(datetime.datetime.combine(local_date, datetime.time(WORK_DAY_END)))
+    return (work_start.astimezone(pytz.utc).replace(tzinfo=None),
+            work_end.astimezone(pytz.utc).replace(tzinfo=None))
+
+def free_slots_from_rows(rows, local_date: datetime.date, timezone: str, duration_minutes: int = 60):
+    """
+    Free intervals of at least `duration_minutes` within working hours of a local day,
+    from the user's rows loaded for work_day_window (no I/O, so it can run in any thread).
+    Busy time comes from timed, non-transparent events, merged as they stream in.
+    Returns [(start, end)] as aware local datetimes.
+    """
+    tz = get_tz(timezone)
+    window_start, window_end = work_day_window(local_date, timezone)
+    min_length = datetime.timedelta(minutes=duration_minutes)
+
+    slots = []
+    cursor = window_start
+    for event in iter_events(rows, window_start, window_end):
+        start_at, all_day = parse_event_bound(event['start'])
+        if all_day or event.get('transparency') == 'transparent':
+            continue
+        end_at, _ = parse_event_bound(event['end'])
+        if start_at - cursor >= min_length:
+            slots.append((cursor, start_at))
+        cursor = max(cursor, end_at)
+    if window_end - cursor >= min_length:
+        slots.append((cursor, window_end))
+
+    return [
+        (pytz.utc.localize(start).astimezone(tz), pytz.utc.localize(end).astimezone(tz))
+        for start, end in slots
+    ]
+
+async def free_slots(user_id: int, local_date: datetime.date, timezone: str, duration_minutes: int = 60):
+    """free_slots_from_rows for a user, loading the rows first."""
+    rows = await load_rows([user_id], *work_day_window(local_date, timezone))
+    return free_slots_from_rows(rows[user_id], local_date, timezone, duration_minutes)
@@ -0,0 +1,179 @@
+# src/calendar/sync.py
+import asyncio
+import datetime
+import json
+from googleapiclient.errors import HttpError
+from sqlalchemy import select, update, delete
+
+from src.auth import get_user_creds
+from src.calendar_tools import build_service, execute
+from src.calendar.recurrence import series_end
+from src.database.session import async_session_maker, insert
+from src.database.models import User, CalendarEvent
+
+# Re-syncs currently running, and users that changed again while their sync was running
+_running: dict[int, asyncio.Task] = {}
+_dirty: set[int] = set()
+
+UPSERT_CHUNK = 200
+
+def parse_event_bound(bound: dict):
+    """
+    Converts a Google start/end object into (naive UTC datetime, all_day).
+    All-day events map to midnight of their date.
+    """
+    if 'dateTime' in bound:
+        dt = datetime.datetime.fromisoformat(bound['dateTime'])
+        return dt.astimezone(datetime.timezone.utc).replace(tzinfo=None), False
+    day = datetime.date.fromisoformat(bound['date'])
+    return datetime.datetime.combine(day, datetime.time.min), True
+
+def _fetch_changes(creds, sync_token: str | None):
+    """
+    Pulls every page of changes since sync_token (or a full listing when it is None).
+    Blocking: run it in a thread.
+    Returns (items, next_sync_token).
+    """
+    service = build_service(creds)
+    items = []
+    page_token = None
+    while True:
+        # Recurring series come as one master + exceptions, expanded locally on demand
+        params = dict(calendarId='primary', singleEvents=False, maxResults=250)
+        if sync_token:
+            params['syncToken'] = sync_token
+        if page_token:
+            params['pageToken'] = page_token
+
+        result = execute(service.events().list(**params))
+        items.extend(result.get('items', []))
+
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            return items, result.get('nextSyncToken')
+
+def _event_row(user_id: int, event: dict) -> dict:
+    # Cancelled exceptions may come without start/end; they only need their original start
+    original = event.get('originalStartTime')
+    start_at, all_day = parse_event_bound(event.get('start') or original)
+    end_at, _ = parse_event_bound(event.get('end') or original)
+    recurrence = event.get('recurrence')
+    return dict(
+        user_id=user_id,
+        event_id=event['id'],
+        summary=event.get('summary'),
+        start_at=start_at,
+        end_at=end_at,
+        all_day=all_day,
+        status=event.get('status', 'confirmed'),
+        recurrence=json.dumps(recurrence) if recurrence else None,
+        series_end=series_end(event) if recurrence else None,
+        recurring_event_id=event.get('recurringEventId'),
+        original_start_at=parse_event_bound(original)[0] if original else None,
+        payload=json.dumps(event, ensure_ascii=False),
+    )
+
+async def sync_user_events(user_id: int) -> int:
+    """
+    Brings the local copy of a user's calendar up to date.
+    Uses the stored sync token, so only events changed since the last sync are transferred;
+    falls back to a full sync when there is no token or Google has invalidated it (410 Gone).
+    Returns the number of changed events.
+    """
+    creds = await get_user_creds(user_id)
+    if not creds:
+        return 0
+
+    async with async_session_maker() as session:
+        result = await session.execute(select(User.sync_token).where(User.telegram_id == user_id))
+        sync_token = result.scalar_one_or_none()
+
+    try:
+        items, next_token = await asyncio.to_thread(_fetch_changes, creds, sync_token)
+    except HttpError as e:
+        if e.resp.status != 410 or not sync_token:
+            raise
+        print(f"Sync token expired for {user_id}, running full sync")
+        sync_token = None
+        items, next_token = await asyncio.to_thread(_fetch_changes, creds, None)
+
+    async with async_session_maker() as session:
+        if sync_token is None:
+            # Full listing replaces whatever we had
+            await session.execute(delete(CalendarEvent).where(CalendarEvent.user_id == user_id))
+
+        # A cancelled exception is kept: it removes one instance of its series.
+        # Anything else cancelled is gone, together with the exceptions of a cancelled series.
+        cancelled = [
+            event['id'] for event in items
+            if event.get('status') == 'cancelled' and not event.get('recurringEventId')
+        ]
+        rows = [
+            _event_row(user_id, event) for event in items
+            if event.get('status') != 'cancelled' or event.get('recurringEventId')
+        ]
+
+        if cancelled:
+            await session.execute(
+                delete(CalendarEvent).where(
+                    CalendarEvent.user_id == user_id,
+                    (CalendarEvent.event_id.in_(cancelled)) | (CalendarEvent.recurring_event_id.in_(cancelled)),
+                )
+            )
+        # Chunked to stay under SQLite's bound-parameter limit on big full syncs
+        for i in range(0, len(rows), UPSERT_CHUNK):
+            stmt = insert(CalendarEvent).values(rows[i:i + UPSERT_CHUNK])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['user_id', 'event_id'],
+                set_=dict(
+                    summary=stmt.excluded.summary,
+                    start_at=stmt.excluded.start_at,
+                    end_at=stmt.excluded.end_at,
+                    all_day=stmt.excluded.all_day,
+                    status=stmt.excluded.status,
+                    recurrence=stmt.excluded.recurrence,
+                    series_end=stmt.excluded.series_end,
+                    recurring_event_id=stmt.excluded.recurring_event_id,
+                    original_start_at=stmt.excluded.original_start_at,
+                    payload=stmt.excluded.payload,
+                )
+            )
+            await session.execute(stmt)
+
+        await session.execute(
+            update(User)
+            .where(User.telegram_id == user_id)
+            .values(sync_token=next_token, last_synced_at=datetime.datetime.utcnow())
+        )
+        await session.commit()
+
+    return len(items)
+
+async def _resync_loop(user_id: int):
+    try:
+        while True:
+            _dirty.discard(user_id)
+            try:
+                await sync_user_events(user_id)
+            except Exception as e:
+                print(f"Error syncing events for {user_id}: {e}")
+                return
+            if user_id not in _dirty:
+                return
+    finally:
+        _running.pop(user_id, None)
+
+def request_resync(user_id: int) -> asyncio.Task:
+    """
+    Schedules an incremental re-sync of a single user.
+    Bursts of notifications collapse: while a sync is running, further requests only
+    cause one more pass after it finishes.
+    """
+    task = _running.get(user_id)
+    if task is not None:
+        _dirty.add(user_id)
+        return task
+
+    task = asyncio.create_task(_resync_loop(user_id))
+    _running[user_id] = task
+    return task
@@ -0,0 +1,279 @@
+# src/calendar/watch.py
+import asyncio
+import datetime
+import secrets
+import uuid
+from urllib.parse import urlsplit
+from sqlalchemy import select, delete
+
+from src.config import WATCH_WEBHOOK_URL, WATCH_CHANNEL_TTL, WATCH_RENEW_MARGIN, SYNC_FALLBACK_INTERVAL
+from src.auth import get_user_creds, get_all_authenticated_users
+from src.calendar_tools import build_service, execute
+from src.calendar.sync import request_resync
+from src.database.session import async_session_maker
+from src.database.models import User, WatchChannel
+
+# Google push notifications (https://developers.google.com/calendar/api/guides/push):
+# we open an events.watch channel per user, Google POSTs an empty notification to
+# WATCH_WEBHOOK_URL whenever that user's calendar changes, and we answer it with an
+# incremental re-sync of that user only. Users without a live channel keep being polled.
+
+def _open_channel(creds, channel_id: str, token: str) -> dict:
+    """Blocking: asks Google to start pushing changes of the primary calendar."""
+    service = build_service(creds)
+    body = {
+        'id': channel_id,
+        'type': 'web_hook',
+        'address': WATCH_WEBHOOK_URL,
+        'token': token,
+        'params': {'ttl': str(WATCH_CHANNEL_TTL)},
+    }
+    return execute(service.events().watch(calendarId='primary', body=body))
+
+def _close_channel(creds, channel_id: str, resource_id: str):
+    """Blocking: stops a channel so Google no longer calls us for it."""
+    service = build_service(creds)
+    execute(service.channels().stop(body={'id': channel_id, 'resourceId': resource_id}))
+
+async def start_watch(user_id: int) -> WatchChannel | None:
+    """
+    Opens a new watch channel for the user and stores it, then stops the user's
+    other channels (a previous login, or the one being renewed). If opening fails,
+    the existing channels are left alone.
+    """
+    creds = await get_user_creds(user_id)
+    if not creds:
+        return None
+
+    channel_id = uuid.uuid4().hex
+    token = secrets.token_urlsafe(32)
+    response = await asyncio.to_thread(_open_channel, creds, channel_id, token)
+
+    # 'expiration' is a Unix timestamp in milliseconds
+    expires_at = datetime.datetime.utcfromtimestamp(int(response['expiration']) / 1000)
+    channel = WatchChannel(
+        channel_id=channel_id,
+        user_id=user_id,
+        resource_id=response['resourceId'],
+        token=token,
+        expires_at=expires_at,
+    )
+    async with async_session_maker() as session:
+        session.add(channel)
+        await session.commit()
+        result = await session.execute(
+            select(WatchChannel).where(WatchChannel.user_id == user_id, WatchChannel.channel_id != channel_id)
+        )
+        previous = result.scalars().all()
+
+    for old in previous:
+        await stop_watch(old)
+    return channel
+
+async def stop_watch(channel: WatchChannel):
+    """Closes a channel on Google's side (best effort) and forgets it."""
+    creds = await get_user_creds(channel.user_id)
+    if creds:
+        try:
+            await asyncio.to_thread(_close_channel, creds, channel.channel_id, channel.resource_id)
+        except Exception as e:
+            print(f"Failed to stop watch channel {channel.channel_id}: {e}")
+
+    async with async_session_maker() as session:
+        await session.execute(delete(WatchChannel).where(WatchChannel.channel_id == channel.channel_id))
+        await session.commit()
+
+async def renew_channels():
+    """
+    Keeps one live channel per authenticated user.
+    A channel close to expiry is replaced: the new one is opened before the old one
+    is stopped, so no change falls between them; if opening fails, the old channel
+    keeps working for the rest of its lifetime. Duplicate channels are stopped.
+    """
+    now = datetime.datetime.utcnow()
+    renew_before = now + datetime.timedelta(seconds=WATCH_RENEW_MARGIN)
+
+    async with async_session_maker() as session:
+        # Expired channels are already closed on Google's side
+        await session.execute(delete(WatchChannel).where(WatchChannel.expires_at <= now))
+        await session.commit()
+        result = await session.execute(select(WatchChannel).order_by(WatchChannel.expires_at.desc()))
+        channels = result.scalars().all()
+
+    by_user = {}
+    for channel in channels:
+        by_user.setdefault(channel.user_id, []).append(channel)
+
+    for user_id, user_channels in by_user.items():
+        if user_channels[0].expires_at > renew_before:
+            for duplicate in user_channels[1:]:
+                await stop_watch(duplicate)
+            continue
+        try:
+            await start_watch(user_id)
+        except Exception as e:
+            print(f"Failed to renew watch channel for {user_id}: {e}")
+
+    for user in await get_all_authenticated_users():
+        if user.telegram_id in by_user:
+            continue
+        try:
+            await start_watch(user.telegram_id)
+        except Exception as e:
+            print(f"Failed to open watch channel for {user.telegram_id}: {e}")
+
+async def poll_unwatched_users():
+    """
+    Polling fallback: re-syncs users that have no live channel (push disabled,
+    channel creation failed or expired) and haven't been synced recently.
+    """
+    now = datetime.datetime.utcnow()
+    stale_before = now - datetime.timedelta(seconds=SYNC_FALLBACK_INTERVAL)
+
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(WatchChannel.user_id).where(WatchChannel.expires_at > now)
+        )
+        watched = set(result.scalars().all())
+
+        result = await session.execute(
+            select(User.telegram_id).where(
+                User.credentials_json.is_not(None),
+                (User.last_synced_at.is_(None)) | (User.last_synced_at < stale_before),
+            )
+        )
+        stale = result.scalars().all()
+
+    for user_id in stale:
+        if user_id not in watched:
+            request_resync(user_id)
+
+async def handle_notification(headers: dict) -> bool:
+    """
+    Handles one push notification (header names lower-cased).
+    Returns False when it doesn't belong to a channel we know.
+    """
+    channel_id = headers.get('x-goog-channel-id')
+    if not channel_id:
+        return False
+
+    async with async_session_maker() as session:
+        channel = await session.get(WatchChannel, channel_id)
+
+    if channel is None:
+        return False
+    if not secrets.compare_digest(headers.get('x-goog-channel-token', ''), channel.token):
+        return False
+    if headers.get('x-goog-resource-id') != channel.resource_id:
+        return False
+
+    # 'sync' is the handshake sent right after the channel is opened
+    if headers.get('x-goog-resource-state') != 'sync':
+        request_resync(channel.user_id)
+    return True
+
+
+class NotificationReceiver:
+    """
+    Minimal asyncio HTTP endpoint for Google's push notifications.
+    Notifications carry everything in headers and Google only needs a quick 2xx,
+    so a full web framework isn't worth the dependency.
+    """
+
+    def __init__(self, host: str, port: int, path: str = None):
+        self.host = host
+        self.port = port
+        self.path = path or urlsplit(WATCH_WEBHOOK_URL or '/').path or '/'
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"Watch receiver listening on {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    @property
+    def port_bound(self) -> int:
+        """Actual port (useful when started with port 0)."""
+        return self._server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer):
+        status = 400
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=10)
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=10)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length') or 0)
+            if length:
+                await reader.readexactly(length)
+
+            if method != 'POST' or urlsplit(target).path != self.path:
+                status = 404
+            elif await handle_notification(headers):
+                status = 200
+            else:
+                status = 404
+        except Exception as e:
+            print(f"Bad watch notification: {e}")
+            status = 400
+
+        reason = {200: 'OK', 404: 'Not Found'}.get(status, 'Bad Request')
+        try:
+            writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+class LocalNotificationEmitter:
+    """
+    Offline stand-in for Google's push delivery: POSTs notifications shaped like
+    Calendar's to a receiver, so the watch path can be exercised without Google.
+    """
+
+    def __init__(self, host: str, port: int, path: str = '/'):
+        self.host = host
+        self.port = port
+        self.path = path
+        self._message_number = 0
+
+    async def emit(self, channel: WatchChannel, resource_state: str = 'exists') -> int:
+        """Sends one notification for the channel and returns the HTTP status code."""
+        self._message_number += 1
+        headers = {
+            'Host': f"{self.host}:{self.port}",
+            'X-Goog-Channel-ID': channel.channel_id,
+            'X-Goog-Channel-Token': channel.token,
+            'X-Goog-Channel-Expiration': channel.expires_at.strftime('%a, %d %b %Y %H:%M:%S GMT'),
+            'X-Goog-Resource-ID': channel.resource_id,
+            'X-Goog-Resource-URI': 'https://www.googleapis.com/calendar/v3/calendars/primary/events',
+            'X-Goog-Resource-State': resource_state,
+            'X-Goog-Message-Number': str(self._message_number),
+            'Content-Length': '0',
+            'Connection': 'close',
+        }
+        request = f"POST {self.path} HTTP/1.1\r\n"
+        request += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        request += "\r\n"
+
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(request.encode('latin-1'))
+            await writer.drain()
+            status_line = await reader.readline()
+            return int(status_line.split()[1])
+        finally:
+            writer.close()
+            await writer.wait_closed()
@@ -1,6 +1,13 @@
+import asyncio
 import datetime
+import uuid
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
-from src.utils.context import current_user_creds
+from googleapiclient.errors import HttpError
+from src.config import GOOGLE_HTTP_TIMEOUT, GOOGLE_CALL_DEADLINE
+from src.utils.context import current_user_id, current_user_creds, current_loop
+from src.utils.resilience import call, google_breaker, note_side_effect
 
 def get_creds():
     """Retrieves credentials from the current context."""
@@ -9,6 +16,19 @@ def get_creds():
         raise ValueError("User not authenticated. Please log in.")
     return creds
 
+def build_service(creds):
+    """Calendar API client whose every HTTP attempt is bounded by GOOGLE_HTTP_TIMEOUT."""
+    http = AuthorizedHttp(creds, http=httplib2.Http(timeout=GOOGLE_HTTP_TIMEOUT))
+    return build('calendar', 'v3', http=http)
+
+def get_service():
+    """Calendar API client for the user in the current context."""
+    return build_service(get_creds())
+
+def execute(request):
+    """Executes a Google API request through the shared retry/deadline/breaker layer."""
+    return call(google_breaker, request.execute, deadline=GOOGLE_CALL_DEADLINE)
+
 def create_calendar_event(title: str, start_time_str: str, duration_hours: int):
     """
     Создает событие в Google Календаре.
@@ -17,8 +37,7 @@ def create_calendar_event(title: str, start_time_str: str, duration_hours: int):
     duration_hours: Длительность в часах.
     """
     try:
-        creds = get_creds()
-        service = build('calendar', 'v3', credentials=creds)
+        service = get_service()
 
         start_time = datetime.datetime.fromisoformat(start_time_str)
         
@@ -37,13 +56,23 @@ def create_calendar_event(title: str, start_time_str: str, duration_hours: int):
              if timezone is None or len(timezone) > 3:
                  timezone = timezone_offset
 
+        # Client-chosen id: if a retried insert already went through, Google answers
+        # 409 instead of creating a duplicate
+        event_id = uuid.uuid4().hex
         event = {
+            'id': event_id,
             'summary': title,
             'start': {'dateTime': start_time.isoformat(), 'timeZone': timezone},
             'end': {'dateTime': end_time.isoformat(), 'timeZone': timezone},
         }
 
-        event = service.events().insert(calendarId='primary', body=event).execute()
+        try:
+            event = execute(service.events().insert(calendarId='primary', body=event))
+        except HttpError as e:
+            if e.resp.status != 409:
+                raise
+            event = execute(service.events().get(calendarId='primary', eventId=event_id))
+        note_side_effect('create_calendar_event')
         return f"Событие '{title}' успешно создано в {start_time.strftime('%H:%M %d-%m-%Y')}. Link: {event.get('htmlLink')}"
 
     except Exception as e:
@@ -58,14 +87,13 @@ def delete_calendar_event_by_summary(event_summary: str):
     event_summary: Часть названия события для поиска.
     """
     try:
-        creds = get_creds()
-        service = build('calendar', 'v3', credentials=creds)
+        service = get_service()
 
         now = datetime.datetime.utcnow().isoformat() + 'Z'  # 'Z' indicates UTC time
 
-        events_result = service.events().list(calendarId='primary', timeMin=now,
-                                              maxResults=20, singleEvents=True,
-                                              orderBy='startTime').execute()
+        events_result = execute(service.events().list(calendarId='primary', timeMin=now,
+                                                      maxResults=20, singleEvents=True,
+                                                      orderBy='startTime'))
         events = events_result.get('items', [])
 
         if not events:
@@ -82,7 +110,13 @@ def delete_calendar_event_by_summary(event_summary: str):
                 break # Удаляем первое совпавшее событие
 
         if found_event_id:
-            service.events().delete(calendarId='primary', eventId=found_event_id).execute()
+            try:
+                execute(service.events().delete(calendarId='primary', eventId=found_event_id))
+            except HttpError as e:
+                # 410: a retried delete whose first attempt went through
+                if e.resp.status != 410:
+                    raise
+            note_side_effect('delete_calendar_event_by_summary')
             return f"Событие '{found_event_summary}' (ID: {found_event_id}) успешно удалено."
         else:
             return f"Не найдено предстоящего события, содержащего '{event_summary}' в названии."
@@ -92,74 +126,128 @@ def delete_calendar_event_by_summary(event_summary: str):
         return f"Не удалось удалить событие. Ошибка: {e}"
 
 
+def format_event_line(event) -> str:
+    start_info = event['start']
+    summary = event.get('summary', 'Без названия')
+
+    if 'dateTime' in start_info:
+        formatted_start = datetime.datetime.fromisoformat(start_info['dateTime']).strftime("%d.%m.%Y %H:%M")
+        time_type = "Дата/Время"
+    else:
+        formatted_start = datetime.date.fromisoformat(start_info['date']).strftime("%d.%m.%Y")
+        time_type = "Дата"
+
+    return f"- {time_type}: {formatted_start} | Название: \"{summary}\""
+
+def format_events_list(events, header: str = "Предстоящие события:") -> str:
+    """Renders a list of events in one pass."""
+    if not events:
+        return "Нет предстоящих событий."
+    return "\n".join([header, *map(format_event_line, events)]) + "\n"
+
+def truncate_lines(text: str, limit: int) -> str:
+    """Cuts text to at most `limit` characters at the end of a whole line, marking the cut with "…"."""
+    if len(text) <= limit:
+        return text
+    cut = text.rfind("\n", 0, limit - 1)
+    return text[:cut + 1] + "…"
+
+def fetch_events_page(time_min: str, page_token: str = None, page_size: int = 10):
+    """
+    One page of upcoming events, using Google's pageToken for continuation.
+    time_min must stay the same for every page of one listing.
+    Returns (events, next_page_token).
+    """
+    service = get_service()
+    params = dict(calendarId='primary', timeMin=time_min, maxResults=page_size,
+                  singleEvents=True, orderBy='startTime')
+    if page_token:
+        params['pageToken'] = page_token
+    events_result = execute(service.events().list(**params))
+    return events_result.get('items', []), events_result.get('nextPageToken')
+
 def list_upcoming_events(max_results: int = 10):
     """
     Показывает список предстоящих событий.
     max_results: Максимальное количество событий.
     """
     try:
-        creds = get_creds()
-        service = build('calendar', 'v3', credentials=creds)
-
         now = datetime.datetime.utcnow().isoformat() + 'Z'
-        events_result = service.events().list(calendarId='primary', timeMin=now,
-                                              maxResults=max_results, singleEvents=True,
-                                              orderBy='startTime').execute()
-        events = events_result.get('items', [])
-
-        if not events:
-            return "Нет предстоящих событий."
-        
-        result = "Предстоящие события:\n"
-        for event in events:
-            start_info = event['start']
-            start_str = start_info.get('dateTime', start_info.get('date'))
-            summary = event.get('summary', 'Без названия')
-            event_id = event['id']
-
-            formatted_start = ""
-            time_type = ""
-
-            if 'dateTime' in start_info:
-                dt_object = datetime.datetime.fromisoformat(start_str)
-                formatted_start = dt_object.strftime("%d.%m.%Y %H:%M")
-                time_type = "Дата/Время"
-            elif 'date' in start_info:
-                date_object = datetime.date.fromisoformat(start_str)
-                formatted_start = date_object.strftime("%d.%m.%Y")
-                time_type = "Дата"
-            
-            result += f"- {time_type}: {formatted_start} | Название: \"{summary}\"\n"
-        return result
+        events, _ = fetch_events_page(now, page_size=max_results)
+        return format_events_list(events)
 
     except Exception as e:
         return f"Ошибка получения списка событий: {e}"
 
-def get_upcoming_events_soon(minutes: int = 15):
+def format_free_slots(target_date, slots):
+    """Formats free intervals [(start, end)] of one day."""
+    date_str = target_date.strftime('%d.%m.%Y')
+    if not slots:
+        return f"🚫 На {date_str} свободного времени не найдено."
+    lines = [f"🕊 Свободное время на {date_str}:"]
+    for start, end in slots:
+        lines.append(f"▫️ {start.strftime('%H:%M')} - {end.strftime('%H:%M')}")
+    return "\n".join(lines)
+
+def find_free_slots(date_str: str, duration_minutes: int = 60):
     """
-    Возвращает список событий, которые начнутся в ближайшие 'minutes' минут.
+    Находит свободные промежутки в календаре пользователя на указанную дату (в рабочие часы).
+    date_str: Дата в формате YYYY-MM-DD.
+    duration_minutes: Минимальная длительность промежутка в минутах.
     """
+    # Imported here: the event store builds on this module
+    from src.calendar.store import get_calendar_state, load_rows, work_day_window, free_slots_from_rows
+
     try:
-        creds = get_creds()
-        service = build('calendar', 'v3', credentials=creds)
-
-        now = datetime.datetime.utcnow()
-        # Look ahead 'minutes'
-        time_max = (now + datetime.timedelta(minutes=minutes)).isoformat() + 'Z'
-        now_iso = now.isoformat() + 'Z'
-
-        events_result = service.events().list(
-            calendarId='primary', 
-            timeMin=now_iso,
-            timeMax=time_max,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        
-        return events_result.get('items', [])
+        user_id = current_user_id.get()
+        loop = current_loop.get()
+        if user_id is None or loop is None:
+            raise ValueError("User not authenticated. Please log in.")
+        target_date = datetime.date.fromisoformat(date_str)
+
+        async def load():
+            timezone, synced = await get_calendar_state(user_id)
+            if not synced:
+                return None, []
+            rows = await load_rows([user_id], *work_day_window(target_date, timezone))
+            return timezone, rows[user_id]
+
+        # Tools run in a worker thread: only the read of the local event copy goes to
+        # the bot's loop (and is cancelled if it doesn't finish in time), the slots are
+        # computed here
+        future = asyncio.run_coroutine_threadsafe(load(), loop)
+        try:
+            timezone, rows = future.result(timeout=GOOGLE_CALL_DEADLINE)
+        except TimeoutError:
+            future.cancel()
+            raise
+        if timezone is None:
+            return "Календарь ещё синхронизируется, попробуйте чуть позже."
+        return format_free_slots(target_date, free_slots_from_rows(rows, target_date, timezone, duration_minutes))
+
     except Exception as e:
-        print(f"Error fetching upcoming events: {e}")
-        return []
+        return f"Ошибка поиска свободного времени: {e}"
+
+def format_events_for_date(target_date, events):
+    """
+    Formats one day's events (Google event dicts, in start order).
+    Shared by the /calendar day view and the morning digest.
+    """
+    if not events:
+        return f"📅 На {target_date.strftime('%d.%m.%Y')} событий нет."
+
+    lines = [f"📅 События на {target_date.strftime('%d.%m.%Y')}:"]
+    for event in events:
+        start_info = event['start']
+        summary = event.get('summary', 'Без названия')
+
+        if 'dateTime' in start_info:
+            start_dt = datetime.datetime.fromisoformat(start_info['dateTime'])
+            lines.append(f"• {start_dt.strftime('%H:%M')} — {summary}")
+        else:
+            lines.append(f"• Весь день — {summary}")
+
+    return "\n".join(lines) + "\n"
 
 def get_events_for_date(target_date):
     """
@@ -167,39 +255,24 @@ def get_events_for_date(target_date):
     target_date: a datetime.date object
     """
     try:
-        creds = get_creds()
-        service = build('calendar', 'v3', credentials=creds)
+        service = get_service()
 
         import datetime as dt
         # Start of day in local time, then convert to UTC for API
         start_of_day = dt.datetime.combine(target_date, dt.time.min).astimezone()
         end_of_day = dt.datetime.combine(target_date, dt.time.max).astimezone()
 
-        events_result = service.events().list(
+        events_result = execute(service.events().list(
             calendarId='primary',
             timeMin=start_of_day.isoformat(),
             timeMax=end_of_day.isoformat(),
             singleEvents=True,
             orderBy='startTime'
-        ).execute()
+        ))
         
         events = events_result.get('items', [])
         
-        if not events:
-            return f"📅 На {target_date.strftime('%d.%m.%Y')} событий нет."
-        
-        result = f"📅 События на {target_date.strftime('%d.%m.%Y')}:\n"
-        for event in events:
-            start_info = event['start']
-            summary = event.get('summary', 'Без названия')
-            
-            if 'dateTime' in start_info:
-                start_dt = dt.datetime.fromisoformat(start_info['dateTime'])
-                result += f"• {start_dt.strftime('%H:%M')} — {summary}\n"
-            else:
-                result += f"• Весь день — {summary}\n"
-        
-        return result
+        return format_events_for_date(target_date, events)
     except Exception as e:
         print(f"Error fetching events for date: {e}")
         return f"Ошибка получения событий: {e}"
@@ -0,0 +1,93 @@
+# src/database/crud.py
+import datetime
+from sqlalchemy import select, update, tuple_
+
+from src.config import TITLE_FETCH_MAX_ATTEMPTS
+from src.database.session import async_session_maker, insert
+from src.database.models import User, Video
+
+async def add_videos(user_id: int, urls: list[str]) -> int:
+    """
+    Adds already-normalized URLs to the user's watch list in one transaction.
+    URLs the user already has are skipped. Returns how many were added.
+    """
+    if not urls:
+        return 0
+
+    now = datetime.datetime.utcnow()
+    async with async_session_maker() as session:
+        # The owner row may not exist yet if the user never logged in
+        await session.execute(
+            insert(User).values(telegram_id=user_id).on_conflict_do_nothing(index_elements=['telegram_id'])
+        )
+        stmt = insert(Video).values([
+            dict(user_id=user_id, url=url, status="unwatched", added_at=now, title_attempts=0)
+            for url in urls
+        ]).on_conflict_do_nothing(index_elements=['user_id', 'url'])
+        result = await session.execute(stmt)
+        await session.commit()
+        return result.rowcount
+
+async def list_videos(user_id: int, status: str = "unwatched", cursor: tuple | None = None,
+                      direction: str = "next", limit: int = 10):
+    """
+    Keyset pagination over the user's videos, newest first.
+    cursor is (added_at, id) of a boundary item:
+      "next" -> items strictly older than it,
+      "prev" -> items strictly newer than it (returned newest first as well),
+      "at"   -> the page starting at it (inclusive).
+    Every page is an index range scan on (user_id, status, added_at, id), so the cost
+    doesn't depend on how many videos the user has.
+    Returns (videos, has_more) where has_more refers to the requested direction.
+    """
+    key = tuple_(Video.added_at, Video.id)
+    stmt = select(Video).where(Video.user_id == user_id, Video.status == status)
+
+    if direction == "prev":
+        if cursor:
+            stmt = stmt.where(key > tuple_(*cursor))
+        stmt = stmt.order_by(Video.added_at.asc(), Video.id.asc())
+    else:
+        if cursor:
+            stmt = stmt.where(key <= tuple_(*cursor) if direction == "at" else key < tuple_(*cursor))
+        stmt = stmt.order_by(Video.added_at.desc(), Video.id.desc())
+
+    async with async_session_maker() as session:
+        result = await session.execute(stmt.limit(limit + 1))
+        videos = list(result.scalars().all())
+
+    has_more = len(videos) > limit
+    videos = videos[:limit]
+    if direction == "prev":
+        videos.reverse()
+    return videos, has_more
+
+async def set_video_status(user_id: int, video_id: int, status: str) -> bool:
+    async with async_session_maker() as session:
+        result = await session.execute(
+            update(Video).where(Video.id == video_id, Video.user_id == user_id).values(status=status)
+        )
+        await session.commit()
+        return result.rowcount == 1
+
+async def videos_missing_titles(limit: int = 20) -> list[Video]:
+    """Videos whose title hasn't been fetched yet (and that haven't failed too often)."""
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(Video)
+            .where(Video.title.is_(None), Video.title_attempts < TITLE_FETCH_MAX_ATTEMPTS)
+            .order_by(Video.id)
+            .limit(limit)
+        )
+        return result.scalars().all()
+
+async def set_video_titles(titles: dict[int, str | None]):
+    """Stores fetched titles; None counts as a failed attempt."""
+    async with async_session_maker() as session:
+        for video_id, title in titles.items():
+            if title:
+                stmt = update(Video).where(Video.id == video_id).values(title=title[:500])
+            else:
+                stmt = update(Video).where(Video.id == video_id).values(title_attempts=Video.title_attempts + 1)
+            await session.execute(stmt)
+        await session.commit()
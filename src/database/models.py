@@ -1,6 +1,6 @@
 # src/database/models.py
 import datetime
-from sqlalchemy import String, func, DateTime
+from sqlalchemy import String, Integer, func, DateTime, Boolean, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 class Base(DeclarativeBase):
@@ -8,10 +8,17 @@ class Base(DeclarativeBase):
 
 class Video(Base):
     __tablename__ = "videos_to_watch"
+    __table_args__ = (
+        UniqueConstraint("user_id", "url", name="uq_videos_user_url"),
+        # Keyset pagination: WHERE user_id=? AND status=? ORDER BY added_at DESC, id DESC
+        Index("ix_videos_user_status_added", "user_id", "status", "added_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    url: Mapped[str] = mapped_column(String(1024), nullable=False)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id"), nullable=False)
+    url: Mapped[str] = mapped_column(String(1024), nullable=False) # normalized, see src/watchlist/urls.py
     title: Mapped[str | None] = mapped_column(String(500)) # (Мы можем добавить заголовок позже)
+    title_attempts: Mapped[int] = mapped_column(Integer, default=0) # failed title fetches
 
     status: Mapped[str] = mapped_column(String(50), default="unwatched") # unwatched, watched, deleted
 
@@ -29,5 +36,103 @@ class User(Base):
     telegram_id: Mapped[int] = mapped_column(primary_key=True)
     credentials_json: Mapped[str | None] = mapped_column(String, nullable=True)
 
+    # Google Calendar incremental sync state (nextSyncToken of the last sync)
+    sync_token: Mapped[str | None] = mapped_column(String, nullable=True)
+    last_synced_at: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True)
+
+    # Morning digest: IANA timezone, delivery time as minutes after local midnight
+    # (None = disabled), the local date it was last delivered for, and when a replica
+    # took it for sending (cleared once the send has finished either way)
+    timezone: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    digest_minute: Mapped[int | None] = mapped_column(Integer, nullable=True, index=True)
+    digest_sent_on: Mapped[str | None] = mapped_column(String(10), nullable=True)
+    digest_claimed_at: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True)
+
     def __repr__(self) -> str:
         return f"User(telegram_id={self.telegram_id!r})"
+
+
+class CalendarEvent(Base):
+    """
+    Local copy of a user's Google Calendar event, kept fresh by incremental sync.
+    Recurring series are stored unexpanded: the master (with `recurrence`) plus its
+    exceptions (rows with `recurring_event_id`); see src/calendar/recurrence.py.
+    """
+    __tablename__ = "calendar_events"
+    __table_args__ = (
+        Index("ix_calendar_events_user_start", "user_id", "start_at"),
+        Index("ix_calendar_events_user_master", "user_id", "recurring_event_id"),
+    )
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id"), primary_key=True)
+    event_id: Mapped[str] = mapped_column(String(1024), primary_key=True)
+    summary: Mapped[str | None] = mapped_column(String, nullable=True)
+
+    # Naive UTC; all-day events are stored as midnight of their date
+    start_at: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True)
+    end_at: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True)
+    all_day: Mapped[bool] = mapped_column(Boolean, default=False)
+    status: Mapped[str] = mapped_column(String(16), default="confirmed")
+
+    # Masters: RRULE/RDATE/EXDATE lines (JSON list) and end of the last instance (None = endless)
+    recurrence: Mapped[str | None] = mapped_column(String, nullable=True)
+    series_end: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True)
+    # Exceptions: the master's id and the start of the instance they replace
+    recurring_event_id: Mapped[str | None] = mapped_column(String(1024), nullable=True)
+    original_start_at: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True)
+
+    # The event exactly as Google returned it (JSON), so existing formatters can be reused
+    payload: Mapped[str] = mapped_column(String, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"CalendarEvent(user_id={self.user_id!r}, event_id={self.event_id!r})"
+
+
+class WatchChannel(Base):
+    """A Google Calendar push notification channel (events.watch) opened for a user."""
+    __tablename__ = "watch_channels"
+
+    channel_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id"), index=True)
+    resource_id: Mapped[str] = mapped_column(String, nullable=False)
+    token: Mapped[str] = mapped_column(String(128), nullable=False)
+    # Naive UTC
+    expires_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"WatchChannel(channel_id={self.channel_id!r}, user_id={self.user_id!r})"
+
+
+class ReminderShardLease(Base):
+    """Ownership of one reminder shard (users with telegram_id % REMINDER_SHARDS == shard_id)."""
+    __tablename__ = "reminder_shard_leases"
+
+    shard_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    owner: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    # Naive UTC; the lease is free once this has passed
+    expires_at: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True)
+
+    def __repr__(self) -> str:
+        return f"ReminderShardLease(shard_id={self.shard_id!r}, owner={self.owner!r})"
+
+
+class ReminderWorker(Base):
+    """Heartbeat of a live reminder worker, used to split shards evenly."""
+    __tablename__ = "reminder_workers"
+
+    worker_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    expires_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False)
+
+
+class SentReminder(Base):
+    """Ledger of claimed and delivered reminders, shared by all workers so none is sent twice."""
+    __tablename__ = "sent_reminders"
+
+    user_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    event_id: Mapped[str] = mapped_column(String(1024), primary_key=True)
+    # Start as reported by Google, so a rescheduled event is reminded again
+    event_start: Mapped[str] = mapped_column(String(64), primary_key=True)
+    sent_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, index=True)
+    # Set while a worker is sending it, NULL once delivered; a claim older than
+    # REMINDER_CLAIM_TIMEOUT was left by a worker that died before sending
+    claimed_at: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True)
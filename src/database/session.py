@@ -1,8 +1,11 @@
 # src/database/session.py
+import datetime
+from sqlalchemy import inspect, literal, delete, update, select, func, UniqueConstraint
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from src.config import DATABASE_URL
-from src.database.models import Base
+from src.database.models import Base, User, CalendarEvent
 
 
 async_engine = create_async_engine(
@@ -16,8 +19,77 @@ async_session_maker = async_sessionmaker(
 )
 
 
+def insert(table):
+    """
+    INSERT supporting ON CONFLICT (on_conflict_do_nothing / on_conflict_do_update)
+    for the configured database - SQLite and PostgreSQL share the same API.
+    """
+    if async_engine.dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+async def database_now(session) -> datetime.datetime:
+    """
+    Current time by the database's clock, as naive UTC. Anything compared across
+    nodes (leases, claims) uses this one clock instead of each node's own.
+    """
+    result = await session.execute(select(func.now()))
+    now = result.scalar_one()
+    if now.tzinfo is not None:
+        now = now.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return now
+
+
+def _add_missing_columns(conn):
+    """
+    create_all() never alters existing tables, so columns added to a model later
+    (e.g. users.sync_token) are added here with ALTER TABLE, together with their
+    indexes and unique constraints (as unique indexes). Idempotent: only what the
+    table doesn't have yet is touched. A NOT NULL column without a default is added
+    as nullable - old rows get NULL, new rows always set it.
+    """
+    inspector = inspect(conn)
+    preparer = conn.dialect.identifier_preparer
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"{preparer.quote(column.name)} {column.type.compile(dialect=conn.dialect)}"
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if default is not None:
+                value = literal(default, column.type).compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+                ddl += f" DEFAULT {value}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            conn.exec_driver_sql(f"ALTER TABLE {preparer.quote(table.name)} ADD COLUMN {ddl}")
+            print(f"Added column {table.name}.{column.name}")
+            added.append((table.name, column.name))
+
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+        unique_names = {c['name'] for c in inspector.get_unique_constraints(table.name)}
+        unique_names |= {i['name'] for i in inspector.get_indexes(table.name) if i['unique']}
+        for constraint in table.constraints:
+            if isinstance(constraint, UniqueConstraint) and constraint.name and constraint.name not in unique_names:
+                columns = ", ".join(preparer.quote(column.name) for column in constraint.columns)
+                conn.exec_driver_sql(
+                    f"CREATE UNIQUE INDEX {preparer.quote(constraint.name)} ON {preparer.quote(table.name)} ({columns})"
+                )
+    return added
+
+
 async def init_db():
 
     async with async_engine.begin() as conn:
         # await conn.run_sync(Base.metadata.drop_all)
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+        added = await conn.run_sync(_add_missing_columns)
+        if ("calendar_events", "recurrence") in added:
+            # The copy was made with singleEvents=True (expanded instances): drop it and resync
+            await conn.execute(delete(CalendarEvent))
+            await conn.execute(update(User).values(sync_token=None, last_synced_at=None))
\ No newline at end of file
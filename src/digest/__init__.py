@@ -0,0 +1 @@
+# src/digest/__init__.py
@@ -0,0 +1,189 @@
+# src/digest/scheduler.py
+import datetime
+import pytz
+from sqlalchemy import select, update, or_, and_
+
+from src.config import DEFAULT_TIMEZONE, DIGEST_CATCHUP_MINUTES, DIGEST_SPREAD, DIGEST_CLAIM_TIMEOUT
+from src.calendar.sync import request_resync
+from src.calendar.store import load_rows, iter_events, occurs_on, local_day_window, get_tz
+from src.calendar_tools import format_events_for_date
+from src.database.session import async_session_maker, insert
+from src.database.models import User
+
+# Morning digest ("today's plan") at each user's chosen local time.
+# Once a minute: users due now are found with one query grouped by timezone, their
+# digests are built from the locally synced events in one batched pass (no Google
+# calls), and messages are spread over the minute through the send queue.
+# A digest counts as sent only once Telegram accepted it: a failed send releases the
+# claim so the next tick retries (within the catch-up window), and a claim left behind
+# by a crashed or restarted replica expires after DIGEST_CLAIM_TIMEOUT. Claims of
+# digests still queued in this process are refreshed every tick, however long the
+# queue takes to drain.
+
+def parse_digest_time(text: str) -> int | None:
+    """'08:30' -> 510 (minutes after midnight); None if not a valid time."""
+    try:
+        parsed = datetime.datetime.strptime(text.strip(), "%H:%M")
+    except ValueError:
+        return None
+    return parsed.hour * 60 + parsed.minute
+
+def format_digest_time(minute: int) -> str:
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+async def set_digest(user_id: int, minute: int | None, timezone: str | None = None):
+    """Enables (minute) or disables (None) the digest; timezone is kept if not given."""
+    values = dict(digest_minute=minute)
+    if timezone:
+        values['timezone'] = timezone
+    async with async_session_maker() as session:
+        stmt = insert(User).values(telegram_id=user_id, **values)
+        stmt = stmt.on_conflict_do_update(index_elements=['telegram_id'], set_=values)
+        await session.execute(stmt)
+        await session.commit()
+
+async def get_digest_settings(user_id: int):
+    """Returns (minute or None, timezone)."""
+    async with async_session_maker() as session:
+        user = await session.get(User, user_id)
+    if not user:
+        return None, DEFAULT_TIMEZONE
+    return user.digest_minute, user.timezone or DEFAULT_TIMEZONE
+
+def is_valid_timezone(timezone: str) -> bool:
+    return timezone in pytz.all_timezones_set
+
+def _due_slots(local_now: datetime.datetime) -> list[tuple[datetime.date, int, int]]:
+    """
+    (slot date, first minute, last minute) ranges of delivery minutes due at local_now.
+    Shortly after local midnight the catch-up window reaches back into the previous
+    day: a 23:55 slot caught up at 00:03 is still that previous day's digest.
+    """
+    minute = local_now.hour * 60 + local_now.minute
+    first = minute - DIGEST_CATCHUP_MINUTES + 1
+    today = local_now.date()
+    slots = [(today, max(first, 0), minute)]
+    if first < 0:
+        slots.append((today - datetime.timedelta(days=1), first + 24 * 60, 24 * 60 - 1))
+    return slots
+
+def _due_condition(timezone: str | None, slot_date: datetime.date, first: int, last: int):
+    """Users of one timezone whose delivery minute is in [first, last] and who haven't got that day's digest."""
+    return and_(
+        User.timezone.is_(None) if timezone is None else User.timezone == timezone,
+        User.digest_minute >= first,
+        User.digest_minute <= last,
+        or_(User.digest_sent_on.is_(None), User.digest_sent_on != slot_date.isoformat()),
+    )
+
+async def refresh_claims(user_ids, now_utc: datetime.datetime):
+    """
+    Keeps the claims of digests still waiting in this process's send queue fresh, so a
+    backlog that takes longer than DIGEST_CLAIM_TIMEOUT to drain isn't taken for the
+    leftovers of a crashed replica and claimed again.
+    """
+    user_ids = list(user_ids)
+    async with async_session_maker() as session:
+        for i in range(0, len(user_ids), 500):
+            await session.execute(
+                update(User)
+                .where(User.telegram_id.in_(user_ids[i:i + 500]), User.digest_claimed_at.is_not(None))
+                .values(digest_claimed_at=now_utc)
+            )
+        await session.commit()
+
+async def claim_due_users(now_utc: datetime.datetime) -> list[tuple[int, datetime.date, datetime.datetime, datetime.datetime]]:
+    """
+    Finds users whose delivery minute has come (within the catch-up window) and who
+    haven't got that day's digest yet, and claims them in the same statement, so
+    concurrent replicas never both send. Users never synced are left for later.
+    Returns (user_id, local date, day start UTC, day end UTC) for each claimed user.
+    """
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(User.timezone).where(User.digest_minute.is_not(None)).distinct()
+        )
+        groups = []
+        for timezone in result.scalars().all():
+            tz = get_tz(timezone)
+            local_now = pytz.utc.localize(now_utc).astimezone(tz)
+            for slot_date, first, last in _due_slots(local_now):
+                groups.append((timezone, slot_date, _due_condition(timezone, slot_date, first, last)))
+        if not groups:
+            return []
+
+        # Not synced yet: the local copy would wrongly say "no events"
+        result = await session.execute(
+            select(User.telegram_id).where(
+                or_(*(condition for _, _, condition in groups)),
+                User.last_synced_at.is_(None),
+            )
+        )
+        for user_id in result.scalars().all():
+            request_resync(user_id)
+
+        stale = now_utc - datetime.timedelta(seconds=DIGEST_CLAIM_TIMEOUT)
+        due = []
+        for timezone, slot_date, condition in groups:
+            result = await session.execute(
+                update(User)
+                .where(
+                    condition,
+                    User.last_synced_at.is_not(None),
+                    or_(User.digest_claimed_at.is_(None), User.digest_claimed_at < stale),
+                )
+                .values(digest_claimed_at=now_utc)
+                .returning(User.telegram_id)
+            )
+            day_start, day_end = local_day_window(slot_date, timezone)
+            for user_id in result.scalars().all():
+                due.append((user_id, slot_date, day_start, day_end))
+        await session.commit()
+    return due
+
+async def finish_digest(user_id: int, local_date: datetime.date, delivered: bool):
+    """Releases the claim; a delivered digest is recorded as sent for that local date."""
+    values = dict(digest_claimed_at=None)
+    if delivered:
+        values['digest_sent_on'] = local_date.isoformat()
+    async with async_session_maker() as session:
+        await session.execute(update(User).where(User.telegram_id == user_id).values(**values))
+        await session.commit()
+
+async def build_digests(due) -> list[tuple[int, str]]:
+    """Renders every due user's digest from one query over the local event copy."""
+    if not due:
+        return []
+
+    window_start = min(day_start for _, _, day_start, _ in due) - datetime.timedelta(days=1)
+    window_end = max(day_end for _, _, _, day_end in due) + datetime.timedelta(days=1)
+    rows = await load_rows([user_id for user_id, _, _, _ in due], window_start, window_end)
+
+    digests = []
+    for user_id, local_date, day_start, day_end in due:
+        # Recurring series are expanded here, only for this user's day
+        events = [
+            event for event in iter_events(rows[user_id], day_start - datetime.timedelta(days=1), day_end + datetime.timedelta(days=1))
+            if occurs_on(event, local_date, day_start, day_end)
+        ]
+        digests.append((user_id, "☀️ Доброе утро! План на сегодня:\n\n" + format_events_for_date(local_date, events)))
+    return digests
+
+async def run_digests(send_queue, now_utc: datetime.datetime = None) -> int:
+    """One scheduler tick. Returns how many digests were queued."""
+    now_utc = now_utc or datetime.datetime.utcnow()
+    await refresh_claims(send_queue.pending_chats(), now_utc)
+    due = await claim_due_users(now_utc)
+    dates = {user_id: local_date for user_id, local_date, _, _ in due}
+    try:
+        digests = await build_digests(due)
+    except Exception:
+        for user_id, local_date in dates.items():
+            await finish_digest(user_id, local_date, False)
+        raise
+
+    async def on_done(user_id, delivered):
+        await finish_digest(user_id, dates[user_id], delivered)
+
+    send_queue.submit_spread(digests, DIGEST_SPREAD, on_done=on_done)
+    return len(digests)
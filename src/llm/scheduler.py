@@ -0,0 +1,297 @@
+# src/llm/scheduler.py
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from contextvars import ContextVar
+from google.api_core import exceptions as api_exceptions
+
+from src.config import (
+    GEMINI_INITIAL_CONCURRENCY, GEMINI_MIN_CONCURRENCY, GEMINI_MAX_CONCURRENCY,
+    GEMINI_LATENCY_TARGET, GEMINI_PATIENCE, GEMINI_CALL_DEADLINE,
+)
+from src.utils.resilience import call_async, gemini_breaker
+
+# Priority classes, lower is served first
+INTERACTIVE = 0
+VOICE = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", VOICE: "voice"}
+
+# When the current request started queueing, if that was before submit() (see user_turn)
+_queued_since: ContextVar[float | None] = ContextVar("gemini_queued_since", default=None)
+
+class RequestShed(Exception):
+    """The request waited in the queue longer than the user's patience; Gemini was not called."""
+
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit.
+    Each fast success adds ~1 slot per window (limit += 1/limit); a 429 halves the
+    limit and a slow response (over the latency target) trims it by 10%.
+    At most one decrease per window: a signal from a request that started before the
+    last decrease describes the old limit and is ignored, so a burst of concurrent
+    429s halves the limit once instead of once per request.
+    """
+
+    def __init__(self, initial: float = GEMINI_INITIAL_CONCURRENCY, minimum: float = GEMINI_MIN_CONCURRENCY,
+                 maximum: float = GEMINI_MAX_CONCURRENCY, latency_target: float = GEMINI_LATENCY_TARGET):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.latency_target = latency_target
+        self.last_decrease = float('-inf')   # monotonic time
+
+    @property
+    def slots(self) -> int:
+        return max(int(self.limit), 1)
+
+    def _decrease(self, factor: float, started_at: float):
+        if started_at < self.last_decrease:
+            return
+        self.limit = max(self.minimum, self.limit * factor)
+        self.last_decrease = time.monotonic()
+
+    def on_success(self, latency: float, started_at: float):
+        if latency > self.latency_target:
+            self._decrease(0.9, started_at)
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_throttled(self, started_at: float):
+        self._decrease(0.5, started_at)
+
+
+class _Request:
+    __slots__ = ("user_id", "priority", "enqueued_at", "granted")
+
+    def __init__(self, user_id: int, priority: int, enqueued_at: float = None):
+        self.user_id = user_id
+        self.priority = priority
+        self.enqueued_at = enqueued_at or time.monotonic()
+        self.granted = asyncio.get_running_loop().create_future()
+
+
+class _ClassStats:
+    __slots__ = ("submitted", "completed", "failed", "shed", "waited", "total_wait", "max_wait")
+
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.shed = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_wait(self, wait: float):
+        self.waited += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+
+class GeminiScheduler:
+    """
+    Admission control in front of Gemini.
+    At most `limit.slots` calls run at once. Waiting requests are served by priority
+    class, and round-robin between users inside a class, so one chatty user can't
+    starve the rest. A request still queued after its patience is shed.
+    A call the handler stopped waiting for (deadline, cancellation) keeps its slot
+    until its worker thread has really finished, so abandoned calls still count
+    against the limit.
+    """
+
+    def __init__(self, limit: AdaptiveLimit = None, patience: dict = None):
+        self.limit = limit or AdaptiveLimit()
+        self.patience = patience or GEMINI_PATIENCE
+        # priority -> user_id -> queued requests of that user (insertion order = turn order)
+        self._queues = {priority: OrderedDict() for priority in PRIORITY_NAMES}
+        self._in_flight = 0
+        self._abandoned = 0
+        self._stats = {priority: _ClassStats() for priority in PRIORITY_NAMES}
+
+    def _queued(self) -> int:
+        return sum(len(q) for users in self._queues.values() for q in users.values())
+
+    def _enqueue(self, request: _Request):
+        users = self._queues[request.priority]
+        users.setdefault(request.user_id, deque()).append(request)
+
+    def _remove(self, request: _Request):
+        users = self._queues[request.priority]
+        queue = users.get(request.user_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(request)
+        except ValueError:
+            return
+        if not queue:
+            del users[request.user_id]
+
+    def _next(self) -> _Request | None:
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if not users:
+                continue
+            user_id, queue = users.popitem(last=False)
+            request = queue.popleft()
+            if queue:
+                # User goes to the back of the line for their next request
+                users[user_id] = queue
+            return request
+        return None
+
+    def _dispatch(self):
+        while self._in_flight < self.limit.slots:
+            request = self._next()
+            if request is None:
+                return
+            if request.granted.done():
+                continue
+            self._in_flight += 1
+            request.granted.set_result(None)
+
+    def _release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _release_abandoned(self):
+        self._abandoned -= 1
+        self._release()
+
+    def _throttled_from_thread(self, loop, started_at: float):
+        loop.call_soon_threadsafe(self.limit.on_throttled, started_at)
+
+    def _shed(self, user_id: int, priority: int, wait: float):
+        stats = self._stats[priority]
+        stats.shed += 1
+        stats.record_wait(wait)
+        print(f"Shed {PRIORITY_NAMES[priority]} Gemini request of {user_id} after {wait:.1f}s in queue")
+        raise RequestShed()
+
+    @asynccontextmanager
+    async def user_turn(self, user_id: int, priority: int, lock):
+        """
+        Holds `lock` (the user's per-message lock) around the body. Waiting for it is
+        queue time like waiting for a slot: it is charged against the class's patience,
+        and a message whose patience runs out behind the user's previous one is shed.
+        """
+        started = time.monotonic()
+        async with AsyncExitStack() as stack:
+            try:
+                async with asyncio.timeout(self.patience[priority]):
+                    await stack.enter_async_context(lock)
+            except TimeoutError:
+                self._stats[priority].submitted += 1
+                self._shed(user_id, priority, time.monotonic() - started)
+            token = _queued_since.set(started)
+            try:
+                yield
+            finally:
+                _queued_since.reset(token)
+
+    async def submit(self, user_id: int, priority: int, fn, *args, deadline: float = GEMINI_CALL_DEADLINE, **kwargs):
+        """
+        Waits for a slot, then runs the blocking Gemini call through the resilience layer.
+        Raises RequestShed if no slot was granted within the class's patience (counted
+        from user_turn, when called inside one).
+        """
+        stats = self._stats[priority]
+        stats.submitted += 1
+
+        request = _Request(user_id, priority, _queued_since.get())
+        self._enqueue(request)
+        self._dispatch()
+
+        patience = max(self.patience[priority] - (time.monotonic() - request.enqueued_at), 0)
+        try:
+            await asyncio.wait({request.granted}, timeout=patience)
+        except asyncio.CancelledError:
+            # Handler cancelled while queued: give the slot back if we already got one
+            self._remove(request)
+            if request.granted.done():
+                self._release()
+            else:
+                request.granted.cancel()
+            raise
+
+        wait = time.monotonic() - request.enqueued_at
+        if not request.granted.done():
+            self._remove(request)
+            request.granted.cancel()
+            self._shed(user_id, priority, wait)
+        stats.record_wait(wait)
+
+        loop = asyncio.get_running_loop()
+        # Whether a worker thread is inside fn, and whether submit() is done with the
+        # call; whichever side finishes last gives the slot back
+        thread_state = {'running': False, 'abandoned': False}
+        state_lock = threading.Lock()
+
+        def attempt(*a, **kw):
+            # Runs in a worker thread; a 429, even one retried later, lowers the limit
+            attempt_started = time.monotonic()
+            with state_lock:
+                if thread_state['abandoned']:
+                    # The thread started after submit() gave up: nothing holds a slot for it
+                    raise asyncio.CancelledError()
+                thread_state['running'] = True
+            try:
+                return fn(*a, **kw)
+            except (api_exceptions.TooManyRequests, api_exceptions.ResourceExhausted):
+                self._throttled_from_thread(loop, attempt_started)
+                raise
+            finally:
+                with state_lock:
+                    thread_state['running'] = False
+                    release = thread_state['abandoned']
+                if release:
+                    try:
+                        loop.call_soon_threadsafe(self._release_abandoned)
+                    except RuntimeError:
+                        pass    # loop already closed on shutdown
+
+        started = time.monotonic()
+        try:
+            result = await call_async(gemini_breaker, attempt, *args, deadline=deadline, **kwargs)
+        except Exception:
+            stats.failed += 1
+            raise
+        else:
+            stats.completed += 1
+            self.limit.on_success(time.monotonic() - started, started)
+            return result
+        finally:
+            with state_lock:
+                still_running = thread_state['running']
+                thread_state['abandoned'] = True
+            if still_running:
+                self._abandoned += 1
+            else:
+                self._release()
+
+    def snapshot(self) -> dict:
+        """Limit, load and per-class queue-time accounting."""
+        classes = {}
+        for priority, stats in self._stats.items():
+            classes[PRIORITY_NAMES[priority]] = {
+                "submitted": stats.submitted,
+                "completed": stats.completed,
+                "failed": stats.failed,
+                "shed": stats.shed,
+                "queued": sum(len(q) for q in self._queues[priority].values()),
+                "avg_wait": round(stats.total_wait / stats.waited, 3) if stats.waited else 0.0,
+                "max_wait": round(stats.max_wait, 3),
+            }
+        return {
+            "limit": round(self.limit.limit, 2),
+            "in_flight": self._in_flight,
+            "abandoned": self._abandoned,
+            "queued": self._queued(),
+            "classes": classes,
+        }
+
+
+gemini_scheduler = GeminiScheduler()
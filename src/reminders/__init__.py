@@ -0,0 +1 @@
+# src/reminders/__init__.py
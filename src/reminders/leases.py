@@ -0,0 +1,130 @@
+# src/reminders/leases.py
+import datetime
+import math
+import os
+import socket
+import time
+import uuid
+from sqlalchemy import select, update, delete, func
+
+from src.config import REMINDER_SHARDS, REMINDER_LEASE_TTL
+from src.database.session import async_session_maker, insert, database_now
+from src.database.models import ReminderShardLease, ReminderWorker
+
+def new_worker_id(prefix: str = "worker") -> str:
+    """Unique, human-readable id for this process."""
+    return f"{prefix}-{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+def shard_of(user_id: int) -> int:
+    return user_id % REMINDER_SHARDS
+
+async def ensure_shards():
+    """Creates the lease rows (idempotent, safe to call from every worker)."""
+    async with async_session_maker() as session:
+        stmt = insert(ReminderShardLease).values(
+            [dict(shard_id=shard_id) for shard_id in range(REMINDER_SHARDS)]
+        ).on_conflict_do_nothing(index_elements=['shard_id'])
+        await session.execute(stmt)
+        await session.commit()
+
+
+class ShardLeaser:
+    """
+    Holds this worker's share of reminder shards.
+    Every `refresh()` renews our heartbeat and leases, then rebalances: the target share
+    is ceil(shards / live workers); surplus shards are released for newcomers and free or
+    expired shards (e.g. of a dead worker) are claimed. Claims are conditional UPDATEs,
+    so two workers can never win the same shard.
+    Heartbeats and lease expiry are written and compared in the database's clock, so
+    skew between nodes can't make a live lease look expired. Locally, a lease is
+    trusted for REMINDER_LEASE_TTL from the moment its renewal began (monotonic).
+    """
+
+    def __init__(self, worker_id: str):
+        self.worker_id = worker_id
+        self.owned: set[int] = set()
+        # Leases are only trusted until this moment (time.monotonic) unless renewed
+        self.valid_until = float('-inf')
+
+    def holds(self, shard_id: int) -> bool:
+        return shard_id in self.owned and time.monotonic() < self.valid_until
+
+    async def refresh(self) -> set[int]:
+        renewal_started = time.monotonic()
+
+        async with async_session_maker() as session:
+            now = await database_now(session)
+            expires_at = now + datetime.timedelta(seconds=REMINDER_LEASE_TTL)
+
+            stmt = insert(ReminderWorker).values(worker_id=self.worker_id, expires_at=expires_at)
+            stmt = stmt.on_conflict_do_update(index_elements=['worker_id'], set_=dict(expires_at=expires_at))
+            await session.execute(stmt)
+            await session.execute(delete(ReminderWorker).where(ReminderWorker.expires_at <= now))
+
+            # Renew everything still recorded as ours
+            await session.execute(
+                update(ReminderShardLease)
+                .where(ReminderShardLease.owner == self.worker_id)
+                .values(expires_at=expires_at)
+            )
+            result = await session.execute(
+                select(ReminderShardLease.shard_id).where(ReminderShardLease.owner == self.worker_id)
+            )
+            owned = set(result.scalars().all())
+
+            result = await session.execute(select(func.count()).select_from(ReminderWorker))
+            live_workers = max(result.scalar_one(), 1)
+            target = math.ceil(REMINDER_SHARDS / live_workers)
+
+            if len(owned) > target:
+                surplus = sorted(owned)[target:]
+                await session.execute(
+                    update(ReminderShardLease)
+                    .where(
+                        ReminderShardLease.shard_id.in_(surplus),
+                        ReminderShardLease.owner == self.worker_id,
+                    )
+                    .values(owner=None, expires_at=None)
+                )
+                owned.difference_update(surplus)
+
+            elif len(owned) < target:
+                result = await session.execute(
+                    select(ReminderShardLease.shard_id).where(
+                        (ReminderShardLease.owner.is_(None)) | (ReminderShardLease.expires_at <= now)
+                    )
+                )
+                for shard_id in result.scalars().all():
+                    if len(owned) >= target:
+                        break
+                    claimed = await session.execute(
+                        update(ReminderShardLease)
+                        .where(
+                            ReminderShardLease.shard_id == shard_id,
+                            (ReminderShardLease.owner.is_(None)) | (ReminderShardLease.expires_at <= now),
+                        )
+                        .values(owner=self.worker_id, expires_at=expires_at)
+                    )
+                    if claimed.rowcount == 1:
+                        owned.add(shard_id)
+
+            await session.commit()
+
+        if owned != self.owned:
+            print(f"Reminder worker {self.worker_id} owns shards {sorted(owned)}")
+        self.owned = owned
+        self.valid_until = renewal_started + REMINDER_LEASE_TTL
+        return owned
+
+    async def release(self):
+        """Gives all shards back at shutdown so others pick them up immediately."""
+        async with async_session_maker() as session:
+            await session.execute(
+                update(ReminderShardLease)
+                .where(ReminderShardLease.owner == self.worker_id)
+                .values(owner=None, expires_at=None)
+            )
+            await session.execute(delete(ReminderWorker).where(ReminderWorker.worker_id == self.worker_id))
+            await session.commit()
+        self.owned = set()
+        self.valid_until = float('-inf')
@@ -0,0 +1,92 @@
+# src/reminders/service.py
+import datetime
+from sqlalchemy import select, delete, or_
+
+from src.config import REMINDER_SHARDS, REMINDER_INTERVAL
+from src.calendar.sync import sync_user_events
+from src.calendar.store import events_between
+from src.database.session import async_session_maker
+from src.database.models import User, WatchChannel, SentReminder
+from src.reminders.leases import ShardLeaser, shard_of
+from src.state.backend import state_backend, LEDGER_RETENTION
+
+REMINDER_WINDOW = datetime.timedelta(minutes=30)
+
+def format_reminder(event: dict) -> str:
+    summary = event.get('summary', 'Без названия')
+    start = event['start']
+    end = event['end']
+
+    if 'dateTime' in start:
+        start_dt = datetime.datetime.fromisoformat(start['dateTime'])
+        end_dt = datetime.datetime.fromisoformat(end['dateTime'])
+        # Format: "Название активности: время(например 16:00 - 17:00"
+        time_range = f"{start_dt.strftime('%H:%M')} - {end_dt.strftime('%H:%M')}"
+        return f"⏰ Напоминание! Скоро: {summary}: {time_range}"
+
+    # All-day event
+    return f"⏰ Напоминание! Сегодня: {summary}"
+
+async def prune_ledger():
+    async with async_session_maker() as session:
+        cutoff = datetime.datetime.utcnow() - LEDGER_RETENTION
+        await session.execute(delete(SentReminder).where(SentReminder.sent_at < cutoff))
+        await session.commit()
+
+async def send_user_reminders(bot, user_id: int, leaser: ShardLeaser, stale: bool = False) -> int:
+    """
+    Reminds one user about events in the next 30 minutes, read from the local event
+    copy (recurring series expanded locally). A stale copy - never synced, or not kept
+    fresh by push notifications - is brought up to date first with an incremental sync.
+    """
+    if stale:
+        await sync_user_events(user_id)
+
+    now = datetime.datetime.utcnow()
+    sent = 0
+    for event in await events_between(user_id, now, now + REMINDER_WINDOW):
+        # Our lease may have lapsed while we were syncing
+        if not leaser.holds(shard_of(user_id)):
+            break
+        if not await state_backend.claim_reminder(user_id, event):
+            continue
+        try:
+            await bot.send_message(chat_id=user_id, text=format_reminder(event))
+        except Exception as e:
+            print(f"Failed to send message to {user_id}: {e}")
+            await state_backend.unclaim_reminder(user_id, event)
+            continue
+        await state_backend.confirm_reminder(user_id, event)
+        sent += 1
+    return sent
+
+async def run_reminder_pass(bot, leaser: ShardLeaser) -> int:
+    """Sends due reminders for every user in the shards this worker holds."""
+    shards = [shard_id for shard_id in leaser.owned if leaser.holds(shard_id)]
+    if not shards:
+        return 0
+
+    now = datetime.datetime.utcnow()
+    fresh_after = now - datetime.timedelta(seconds=REMINDER_INTERVAL)
+    async with async_session_maker() as session:
+        watched = select(WatchChannel.user_id).where(WatchChannel.expires_at > now)
+        stmt = select(
+            User.telegram_id,
+            or_(
+                User.last_synced_at.is_(None),
+                (User.telegram_id.not_in(watched)) & (User.last_synced_at < fresh_after),
+            ),
+        ).where(
+            User.credentials_json.is_not(None),
+            (User.telegram_id % REMINDER_SHARDS).in_(shards),
+        )
+        result = await session.execute(stmt)
+        users = result.all()
+
+    sent = 0
+    for user_id, stale in users:
+        try:
+            sent += await send_user_reminders(bot, user_id, leaser, stale=bool(stale))
+        except Exception as e:
+            print(f"Error sending reminders to {user_id}: {e}")
+    return sent
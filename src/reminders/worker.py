@@ -0,0 +1,67 @@
+# src/reminders/worker.py
+import asyncio
+import signal
+import time
+import telegram
+
+from src.config import TELEGRAM_TOKEN, REMINDER_INTERVAL, REMINDER_LEASE_RENEW
+from src.database.session import init_db
+from src.reminders.leases import ShardLeaser, ensure_shards, new_worker_id
+from src.reminders.service import run_reminder_pass, prune_ledger
+from src.state.backend import state_backend
+
+# Standalone reminder worker: run any number of `python reminder_worker.py` processes
+# (on any node sharing the database) next to the bot. Shards are split between live
+# workers automatically and taken over within REMINDER_LEASE_TTL when one dies.
+
+async def _renew_loop(leaser: ShardLeaser, stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            await leaser.refresh()
+        except Exception as e:
+            print(f"Error renewing reminder leases: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=REMINDER_LEASE_RENEW)
+        except asyncio.TimeoutError:
+            pass
+
+async def _reminder_loop(bot, leaser: ShardLeaser, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.monotonic()
+        try:
+            await run_reminder_pass(bot, leaser)
+            await prune_ledger()
+        except Exception as e:
+            print(f"Error in reminder pass: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=max(REMINDER_INTERVAL - (time.monotonic() - started), 0))
+        except asyncio.TimeoutError:
+            pass
+
+async def worker_main():
+    await init_db()
+    await ensure_shards()
+    await state_backend.start()
+
+    leaser = ShardLeaser(new_worker_id())
+    print(f"Reminder worker {leaser.worker_id} запускается...")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with telegram.Bot(TELEGRAM_TOKEN) as bot:
+        await leaser.refresh()
+        try:
+            await asyncio.gather(
+                _renew_loop(leaser, stop),
+                _reminder_loop(bot, leaser, stop),
+            )
+        finally:
+            await leaser.release()
+            await state_backend.stop()
+            print(f"Reminder worker {leaser.worker_id} остановлен")
+
+def run_worker():
+    asyncio.run(worker_main())
@@ -0,0 +1 @@
+# src/state/__init__.py
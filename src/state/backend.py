@@ -0,0 +1,189 @@
+# src/state/backend.py
+import abc
+import asyncio
+import datetime
+from sqlalchemy import delete, update
+
+from src.config import STATE_BACKEND, CHAT_HISTORY_LIMIT, REMINDER_CLAIM_TIMEOUT
+from src.database.session import async_session_maker, insert, database_now
+from src.database.models import SentReminder
+
+# State that has to be shared once more than one bot replica serves the same token:
+# Gemini chat history, per-user locks, the reminder ledger and cache invalidation.
+# MemoryStateBackend keeps everything in this process (single replica);
+# RedisStateBackend (src/state/redis_backend.py) shares it between replicas.
+
+LEDGER_RETENTION = datetime.timedelta(days=2)
+
+def reminder_key(user_id: int, event: dict) -> tuple[int, str, str]:
+    """Identity of one reminder: user, event and this occurrence's start."""
+    start = event['start']
+    return user_id, event['id'], start.get('dateTime', start.get('date'))
+
+def trim_history(history: list, limit: int = CHAT_HISTORY_LIMIT) -> list:
+    """
+    Last `limit` turns, starting at a user turn that isn't a function response -
+    Gemini rejects a history that opens in the middle of a function-calling exchange.
+    """
+    history = history[-limit:]
+    for i, content in enumerate(history):
+        if content.role == 'user' and not any('function_response' in part for part in content.parts):
+            return history[i:]
+    return []
+
+
+class StateBackend(abc.ABC):
+    """
+    Interface of the shared state. The reminder ledger defaults to the database,
+    which every replica and reminder worker already shares; everything else has to be
+    provided by the backend (an incomplete one can't be instantiated).
+    """
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    # Chat history: list of protos.Content, oldest first
+
+    @abc.abstractmethod
+    async def load_history(self, user_id: int) -> list:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def append_history(self, user_id: int, contents: list):
+        raise NotImplementedError
+
+    # Locks
+
+    @abc.abstractmethod
+    def user_lock(self, user_id: int):
+        """Async context manager: one message of a user is processed at a time."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def try_acquire(self, name: str, ttl: float) -> bool:
+        """Non-blocking lock that simply expires after `ttl` seconds (e.g. one replica per job run)."""
+        raise NotImplementedError
+
+    # Cache invalidation
+
+    @abc.abstractmethod
+    def add_invalidation_listener(self, callback):
+        """callback(kind, key) runs when another process changed `key`; key None means "drop everything"."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def publish_invalidation(self, kind: str, key):
+        """Tells the other processes that `key` of `kind` changed."""
+        raise NotImplementedError
+
+    # Reminder ledger: claim -> send -> confirm (or unclaim if the send failed).
+    # A claim that is never confirmed or undone (the worker died in between) can be
+    # taken over after REMINDER_CLAIM_TIMEOUT, so the reminder is retried, not lost.
+
+    async def claim_reminder(self, user_id: int, event: dict) -> bool:
+        """Claims the reminder for sending; False if some worker sent it or is sending it."""
+        user_id, event_id, event_start = reminder_key(user_id, event)
+        async with async_session_maker() as session:
+            now = await database_now(session)
+            stmt = insert(SentReminder).values(
+                user_id=user_id,
+                event_id=event_id,
+                event_start=event_start,
+                sent_at=now,
+                claimed_at=now,
+            ).on_conflict_do_nothing()
+            result = await session.execute(stmt)
+            claimed = result.rowcount == 1
+            if not claimed:
+                result = await session.execute(
+                    update(SentReminder)
+                    .where(
+                        SentReminder.user_id == user_id,
+                        SentReminder.event_id == event_id,
+                        SentReminder.event_start == event_start,
+                        SentReminder.claimed_at < now - datetime.timedelta(seconds=REMINDER_CLAIM_TIMEOUT),
+                    )
+                    .values(sent_at=now, claimed_at=now)
+                )
+                claimed = result.rowcount == 1
+            await session.commit()
+            return claimed
+
+    async def confirm_reminder(self, user_id: int, event: dict):
+        """Records a claimed reminder as delivered."""
+        user_id, event_id, event_start = reminder_key(user_id, event)
+        async with async_session_maker() as session:
+            await session.execute(
+                update(SentReminder)
+                .where(
+                    SentReminder.user_id == user_id,
+                    SentReminder.event_id == event_id,
+                    SentReminder.event_start == event_start,
+                )
+                .values(claimed_at=None)
+            )
+            await session.commit()
+
+    async def unclaim_reminder(self, user_id: int, event: dict):
+        """Undo a claim whose message could not be delivered, so it's retried next pass."""
+        user_id, event_id, event_start = reminder_key(user_id, event)
+        async with async_session_maker() as session:
+            await session.execute(
+                delete(SentReminder).where(
+                    SentReminder.user_id == user_id,
+                    SentReminder.event_id == event_id,
+                    SentReminder.event_start == event_start,
+                )
+            )
+            await session.commit()
+
+
+class MemoryStateBackend(StateBackend):
+    """Process-local state: history objects are kept as they are, no serialization at all."""
+
+    def __init__(self):
+        self._histories = {}
+        self._locks = {}
+        self._expiring = {}
+        self._listeners = []
+
+    async def load_history(self, user_id: int) -> list:
+        return trim_history(self._histories.get(user_id, []))
+
+    async def append_history(self, user_id: int, contents: list):
+        history = self._histories.setdefault(user_id, [])
+        history.extend(contents)
+        del history[:-CHAT_HISTORY_LIMIT]
+
+    def user_lock(self, user_id: int):
+        if user_id not in self._locks:
+            self._locks[user_id] = asyncio.Lock()
+        return self._locks[user_id]
+
+    async def try_acquire(self, name: str, ttl: float) -> bool:
+        now = asyncio.get_running_loop().time()
+        if self._expiring.get(name, 0) > now:
+            return False
+        self._expiring[name] = now + ttl
+        return True
+
+    def add_invalidation_listener(self, callback):
+        self._listeners.append(callback)
+
+    async def publish_invalidation(self, kind: str, key):
+        # Single process: nobody else holds a copy
+        pass
+
+
+def create_state_backend() -> StateBackend:
+    if STATE_BACKEND == "redis":
+        from src.state.redis_backend import RedisStateBackend
+        return RedisStateBackend()
+    if STATE_BACKEND != "memory":
+        raise ValueError(f"Unknown STATE_BACKEND: {STATE_BACKEND}")
+    return MemoryStateBackend()
+
+state_backend = create_state_backend()
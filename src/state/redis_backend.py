@@ -0,0 +1,178 @@
+# src/state/redis_backend.py
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from google.generativeai import protos
+
+from src.config import REDIS_URL, CHAT_HISTORY_LIMIT, USER_LOCK_TTL, REMINDER_CLAIM_TIMEOUT
+from src.state.backend import StateBackend, LEDGER_RETENTION, reminder_key, trim_history
+
+try:
+    import redis.asyncio as redis
+except ImportError:     # only needed with STATE_BACKEND=redis
+    redis = None
+
+KEY_PREFIX = "hope:"
+INVALIDATION_CHANNEL = KEY_PREFIX + "invalidate"
+
+# Deletes the lock only if we still own it (it may have expired and been taken over)
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Extends the lock's TTL, again only if we still own it
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class RedisStateBackend(StateBackend):
+    """
+    State shared between replicas through any Redis-protocol server.
+    `client` may be any redis.asyncio-compatible client (e.g. a local stand-in such as
+    fakeredis); by default one is created from REDIS_URL.
+    History entries are stored as protobuf bytes in a capped list, so a message costs
+    one LRANGE plus one pipelined RPUSH/LTRIM of the new turns only.
+    A user lock is renewed every lock_ttl/3 while held, however long the Gemini call
+    runs; lock_ttl only bounds how long a crashed replica's lock blocks the user.
+    """
+
+    def __init__(self, client=None, url: str = REDIS_URL, lock_ttl: float = USER_LOCK_TTL):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("STATE_BACKEND=redis needs the 'redis' package")
+            client = redis.from_url(url)
+        self.client = client
+        self.lock_ttl = lock_ttl
+        self.instance_id = uuid.uuid4().hex
+        self._local_locks = {}
+        self._listeners = []
+        self._listener_task = None
+
+    async def start(self):
+        self._listener_task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener_task:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+        await self.client.aclose()
+
+    # Chat history
+
+    async def load_history(self, user_id: int) -> list:
+        entries = await self.client.lrange(f"{KEY_PREFIX}chat:{user_id}", 0, -1)
+        return trim_history([protos.Content.deserialize(entry) for entry in entries])
+
+    async def append_history(self, user_id: int, contents: list):
+        if not contents:
+            return
+        key = f"{KEY_PREFIX}chat:{user_id}"
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, *(protos.Content.serialize(content) for content in contents))
+            pipe.ltrim(key, -CHAT_HISTORY_LIMIT, -1)
+            await pipe.execute()
+
+    # Locks
+
+    @asynccontextmanager
+    async def user_lock(self, user_id: int):
+        # Waiters in this process queue on a local lock, so only one of them polls Redis
+        if user_id not in self._local_locks:
+            self._local_locks[user_id] = asyncio.Lock()
+        async with self._local_locks[user_id]:
+            key = f"{KEY_PREFIX}lock:user:{user_id}"
+            token = uuid.uuid4().hex
+            ttl_ms = int(self.lock_ttl * 1000)
+            delay = 0.01
+            while not await self.client.set(key, token, nx=True, px=ttl_ms):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.2)
+            renewal = asyncio.create_task(self._renew_lock(key, token, ttl_ms))
+            try:
+                yield
+            finally:
+                renewal.cancel()
+                try:
+                    await renewal
+                except asyncio.CancelledError:
+                    pass
+                await self.client.eval(RELEASE_SCRIPT, 1, key, token)
+
+    async def _renew_lock(self, key: str, token: str, ttl_ms: int):
+        while True:
+            await asyncio.sleep(self.lock_ttl / 3)
+            try:
+                if not await self.client.eval(RENEW_SCRIPT, 1, key, token, ttl_ms):
+                    print(f"Lock {key} was lost while held")
+                    return
+            except Exception as e:
+                # Keep trying: the lock is still valid for the rest of its TTL
+                print(f"Error renewing lock {key}: {e}")
+
+    async def try_acquire(self, name: str, ttl: float) -> bool:
+        return bool(await self.client.set(f"{KEY_PREFIX}lock:{name}", self.instance_id, nx=True, px=int(ttl * 1000)))
+
+    # Cache invalidation
+
+    def add_invalidation_listener(self, callback):
+        self._listeners.append(callback)
+
+    async def publish_invalidation(self, kind: str, key):
+        await self.client.publish(INVALIDATION_CHANNEL, f"{self.instance_id}|{kind}|{key}")
+
+    def _notify(self, kind: str, key):
+        for callback in self._listeners:
+            try:
+                callback(kind, key)
+            except Exception as e:
+                print(f"Error in invalidation listener: {e}")
+
+    async def _listen(self):
+        first = True
+        while True:
+            try:
+                async with self.client.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    if not first:
+                        # Messages sent while we were disconnected are lost
+                        self._notify("*", None)
+                    first = False
+                    async for message in pubsub.listen():
+                        if message['type'] != 'message':
+                            continue
+                        origin, kind, key = message['data'].decode().split("|", 2)
+                        if origin != self.instance_id:
+                            self._notify(kind, key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Invalidation subscription lost: {e}")
+                await asyncio.sleep(1)
+
+    # Reminder ledger
+
+    async def claim_reminder(self, user_id: int, event: dict) -> bool:
+        # A claim expires on its own if the worker dies before confirming
+        user_id, event_id, event_start = reminder_key(user_id, event)
+        key = f"{KEY_PREFIX}reminder:{user_id}:{event_id}:{event_start}"
+        return bool(await self.client.set(key, "claimed", nx=True, ex=REMINDER_CLAIM_TIMEOUT))
+
+    async def confirm_reminder(self, user_id: int, event: dict):
+        user_id, event_id, event_start = reminder_key(user_id, event)
+        key = f"{KEY_PREFIX}reminder:{user_id}:{event_id}:{event_start}"
+        await self.client.set(key, "sent", ex=int(LEDGER_RETENTION.total_seconds()))
+
+    async def unclaim_reminder(self, user_id: int, event: dict):
+        user_id, event_id, event_start = reminder_key(user_id, event)
+        await self.client.delete(f"{KEY_PREFIX}reminder:{user_id}:{event_id}:{event_start}")
@@ -4,7 +4,9 @@ from datetime import date
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
 # Callback data format: CALENDAR|ACTION|YEAR|MONTH|DAY
-# Actions: IGNORE, DAY, PREV, NEXT
+# Actions: IGNORE, DAY, PREV, NEXT, TODAY
+# EVENTS: page of the /events list; the listing id travels in the YEAR field and
+# the page number in the DAY field
 
 DAYS_OF_WEEK = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
 MONTHS_RU = [
@@ -12,9 +14,10 @@ MONTHS_RU = [
     "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"
 ]
 
-def create_calendar(year: int = None, month: int = None) -> InlineKeyboardMarkup:
+def create_calendar(year: int = None, month: int = None, marked_days=()) -> InlineKeyboardMarkup:
     """
     Creates an inline keyboard with a calendar for the given year and month.
+    Days in `marked_days` (days of the month that have events) get a dot.
     """
     now = date.today()
     if year is None:
@@ -53,8 +56,9 @@ def create_calendar(year: int = None, month: int = None) -> InlineKeyboardMarkup
                     callback_data=f"CALENDAR|IGNORE|{year}|{month}|0"
                 ))
             else:
+                label = f"{day_num}•" if day_num in marked_days else str(day_num)
                 row.append(InlineKeyboardButton(
-                    str(day_num),
+                    label,
                     callback_data=f"CALENDAR|DAY|{year}|{month}|{day_num}"
                 ))
         keyboard.append(row)
@@ -92,6 +96,15 @@ def create_calendar(year: int = None, month: int = None) -> InlineKeyboardMarkup
     
     return InlineKeyboardMarkup(keyboard)
 
+def create_events_navigation(listing_id: int, page: int, has_next: bool) -> InlineKeyboardMarkup | None:
+    """Prev/next buttons for a page of one /events listing."""
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("◀️ Назад", callback_data=f"CALENDAR|EVENTS|{listing_id}|0|{page - 1}"))
+    if has_next:
+        row.append(InlineKeyboardButton("Далее ▶️", callback_data=f"CALENDAR|EVENTS|{listing_id}|0|{page + 1}"))
+    return InlineKeyboardMarkup([row]) if row else None
+
 def parse_callback_data(data: str) -> dict:
     """Parses callback data string into a dictionary."""
     parts = data.split("|")
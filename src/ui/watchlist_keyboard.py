@@ -0,0 +1,58 @@
+# src/ui/watchlist_keyboard.py
+import datetime
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+# Callback data format: WATCH|ACTION|VIDEO_ID|CURSOR_TIME|CURSOR_ID
+# Actions: NEXT (older than cursor), PREV (newer than cursor), DONE (mark VIDEO_ID watched
+# and redraw the page starting at cursor), IGNORE
+# The cursor is (added_at, id) of a boundary item, so paging never uses OFFSET.
+
+CURSOR_TIME_FORMAT = "%Y%m%d%H%M%S%f"
+
+def encode_cursor(video) -> str:
+    return f"{video.added_at.strftime(CURSOR_TIME_FORMAT)}|{video.id}"
+
+def parse_watch_callback(data: str) -> dict:
+    """Parses callback data string into a dictionary."""
+    parts = data.split("|")
+    cursor = None
+    if parts[3]:
+        cursor = (datetime.datetime.strptime(parts[3], CURSOR_TIME_FORMAT), int(parts[4]))
+    return {
+        "prefix": parts[0],
+        "action": parts[1],
+        "video_id": int(parts[2]),
+        "cursor": cursor,
+    }
+
+def render_videos_page(videos, has_older: bool, has_newer: bool):
+    """Builds (text, keyboard) for one page of the watch list."""
+    if not videos:
+        return "🎬 Список «Смотреть позже» пуст. Пришли мне ссылку — я её сохраню.", None
+
+    lines = ["🎬 Смотреть позже:"]
+    for number, video in enumerate(videos, start=1):
+        if video.title:
+            lines.append(f"{number}. {video.title}\n    {video.url}")
+        else:
+            lines.append(f"{number}. {video.url}")
+    text = "\n".join(lines)
+
+    first = encode_cursor(videos[0])
+    last = encode_cursor(videos[-1])
+
+    done_buttons = [
+        InlineKeyboardButton(f"✅ {number}", callback_data=f"WATCH|DONE|{video.id}|{first}")
+        for number, video in enumerate(videos, start=1)
+    ]
+    keyboard = [done_buttons[i:i + 4] for i in range(0, len(done_buttons), 4)]
+
+    navigation = []
+    if has_newer:
+        navigation.append(InlineKeyboardButton("◀️ Новее", callback_data=f"WATCH|PREV|0|{first}"))
+    if has_older:
+        navigation.append(InlineKeyboardButton("Старее ▶️", callback_data=f"WATCH|NEXT|0|{last}"))
+    if navigation:
+        keyboard.append(navigation)
+
+    return text, InlineKeyboardMarkup(keyboard)
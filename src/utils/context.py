@@ -1,5 +1,8 @@
+import asyncio
 from contextvars import ContextVar
 from google.oauth2.credentials import Credentials
 
 current_user_id: ContextVar[int | None] = ContextVar("current_user_id", default=None)
 current_user_creds: ContextVar[Credentials | None] = ContextVar("current_user_creds", default=None)
+# Event loop of the handler, so tools running in worker threads can reach async code
+current_loop: ContextVar[asyncio.AbstractEventLoop | None] = ContextVar("current_loop", default=None)
@@ -0,0 +1,292 @@
+# src/utils/resilience.py
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from contextvars import ContextVar
+from googleapiclient.errors import HttpError
+from google.api_core import exceptions as api_exceptions
+
+from src.config import (
+    RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY,
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_TIMEOUT,
+)
+
+# Shared wrapper for outbound calls to Google Calendar and Gemini:
+# an overall deadline per call, jittered exponential backoff on 429/5xx/network errors
+# (honouring Retry-After when the server sends one) and a circuit breaker per dependency
+# so that while it is down we fail fast instead of piling up stuck handlers.
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """Raised without touching the dependency while its breaker is open."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} is unavailable, retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+class DeadlineExceeded(TimeoutError):
+    """
+    The call (including retries) did not finish within its deadline.
+    `outcome_unknown` is set when the abandoned call had already changed something or
+    was in the middle of a Google request that may still go through.
+    """
+
+    def __init__(self, message: str, outcome_unknown: bool = False):
+        super().__init__(message)
+        self.outcome_unknown = outcome_unknown
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker.
+    closed    -> calls pass; `failure_threshold` consecutive failures open it.
+    open      -> calls fail fast with CircuitOpenError for `recovery_timeout` seconds.
+    half_open -> a single probe call is let through; success closes, failure re-opens.
+    Thread-safe: Google calls run in worker threads.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 recovery_timeout: float = BREAKER_RECOVERY_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.total_failures = 0
+        self.total_rejected = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            elapsed = time.monotonic() - self.opened_at
+            if self.state == "open" and elapsed >= self.recovery_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.total_rejected += 1
+            raise CircuitOpenError(self.name, max(self.recovery_timeout - elapsed, 0))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                print(f"Circuit '{self.name}' closed")
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.total_failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"Circuit '{self.name}' opened after {self.failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            retry_in = 0.0
+            if self.state == "open":
+                retry_in = max(self.recovery_timeout - (time.monotonic() - self.opened_at), 0)
+            return {
+                "name": self.name,
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "total_failures": self.total_failures,
+                "total_rejected": self.total_rejected,
+                "retry_in": round(retry_in, 1),
+            }
+
+
+google_breaker = CircuitBreaker("google")
+gemini_breaker = CircuitBreaker("gemini")
+
+def breaker_states() -> list[dict]:
+    """Current state of every dependency breaker (for /status and logs)."""
+    return [google_breaker.snapshot(), gemini_breaker.snapshot()]
+
+class _CallState:
+    """
+    Bookkeeping of one wrapped call, visible to the calls it makes (tools run by Gemini
+    call Google from the same worker thread, with a copy of the same context).
+    effects        - writes that happened during the call. A call that already changed
+                     something (e.g. Gemini ran a calendar tool before failing) must not
+                     be retried, otherwise the change would be applied twice.
+    abandoned      - the caller stopped waiting; the worker thread may still be running,
+                     and calls made from it are refused so nothing is changed behind the
+                     back of a user who was already told the request failed.
+    nested_running - wrapped calls currently made from inside this one.
+    """
+    __slots__ = ("parent", "effects", "abandoned", "nested_running")
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.effects = []
+        self.abandoned = False
+        self.nested_running = 0
+
+    def caller_gave_up(self) -> bool:
+        state = self
+        while state is not None:
+            if state.abandoned:
+                return True
+            state = state.parent
+        return False
+
+_current_call: ContextVar[_CallState | None] = ContextVar("resilience_call", default=None)
+
+def note_side_effect(description: str):
+    """Marks the current wrapped call as non-retryable from now on."""
+    state = _current_call.get()
+    if state is not None:
+        state.effects.append(description)
+
+def _status_of(exc: Exception) -> int | None:
+    if isinstance(exc, HttpError):
+        return exc.resp.status
+    if isinstance(exc, api_exceptions.GoogleAPICallError):
+        return exc.code if isinstance(exc.code, int) else None
+    return None
+
+def is_retryable(exc: Exception) -> bool:
+    """True for failures that say nothing about the request itself: throttling, 5xx, network."""
+    if isinstance(exc, (TimeoutError, ConnectionError, api_exceptions.RetryError)):
+        return True
+    return _status_of(exc) in RETRYABLE_STATUSES
+
+def retry_after(exc: Exception) -> float | None:
+    """Seconds the server asked us to wait (Retry-After header or gRPC RetryInfo), if any."""
+    value = None
+    if isinstance(exc, HttpError):
+        value = exc.resp.get('retry-after')
+    elif isinstance(exc, api_exceptions.GoogleAPICallError):
+        for detail in exc.details or ():
+            delay = getattr(detail, 'retry_delay', None)
+            if delay is not None:
+                return delay.seconds + delay.nanos / 1e9
+        response = exc.response
+        headers = getattr(response, 'headers', None)
+        if headers:
+            value = headers.get('retry-after')
+
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+        return max(when.timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def _next_delay(exc: Exception, attempt: int) -> float:
+    # Full jitter: spreads retries of many handlers instead of synchronising them
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    server_delay = retry_after(exc)
+    if server_delay is not None:
+        delay = max(delay, server_delay)
+    return delay
+
+def _give_up(exc: Exception, attempt: int, max_attempts: int, effects: list) -> bool:
+    return not is_retryable(exc) or attempt + 1 >= max_attempts or bool(effects)
+
+def call(breaker: CircuitBreaker, fn, *args, deadline: float, max_attempts: int = RETRY_MAX_ATTEMPTS, **kwargs):
+    """
+    Runs a blocking call with retries and the breaker.
+    Each attempt must be bounded by its own transport timeout; `deadline` caps
+    the total time including backoff sleeps. Made from inside a wrapped call whose
+    caller has given up, it raises DeadlineExceeded instead of starting an attempt.
+    """
+    parent = _current_call.get()
+    state = _CallState(parent)
+    token = _current_call.set(state)
+    if parent is not None:
+        parent.nested_running += 1
+    try:
+        give_up_at = time.monotonic() + deadline
+        attempt = 0
+        while True:
+            if parent is not None and parent.caller_gave_up():
+                raise DeadlineExceeded(f"{breaker.name} call dropped: the caller gave up")
+            breaker.before_call()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if is_retryable(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if _give_up(e, attempt, max_attempts, state.effects):
+                    raise
+                delay = _next_delay(e, attempt)
+                if time.monotonic() + delay >= give_up_at:
+                    raise DeadlineExceeded(f"{breaker.name} call exceeded {deadline}s") from e
+                print(f"{breaker.name} call failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            breaker.record_success()
+            return result
+    finally:
+        if parent is not None:
+            parent.nested_running -= 1
+        _current_call.reset(token)
+
+async def call_async(breaker: CircuitBreaker, fn, *args, deadline: float, max_attempts: int = RETRY_MAX_ATTEMPTS, **kwargs):
+    """
+    Async counterpart of `call` for blocking SDK functions: each attempt runs in a
+    worker thread and the handler stops waiting once `deadline` is spent. The thread
+    can't be stopped, but from then on every wrapped call it makes is refused.
+    """
+    state = _CallState(_current_call.get())
+    token = _current_call.set(state)
+    try:
+        give_up_at = time.monotonic() + deadline
+        attempt = 0
+        while True:
+            breaker.before_call()
+            remaining = give_up_at - time.monotonic()
+            try:
+                # to_thread copies the context, so tools see this call's state too
+                result = await asyncio.wait_for(asyncio.to_thread(fn, *args, **kwargs), timeout=remaining)
+            except Exception as e:
+                if isinstance(e, TimeoutError) and time.monotonic() >= give_up_at:
+                    # wait_for gave up; the thread finishes in the background
+                    state.abandoned = True
+                    breaker.record_failure()
+                    raise DeadlineExceeded(
+                        f"{breaker.name} call exceeded {deadline}s",
+                        outcome_unknown=bool(state.effects) or state.nested_running > 0,
+                    ) from e
+                if is_retryable(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if _give_up(e, attempt, max_attempts, state.effects):
+                    raise
+                delay = _next_delay(e, attempt)
+                if time.monotonic() + delay >= give_up_at:
+                    raise DeadlineExceeded(f"{breaker.name} call exceeded {deadline}s") from e
+                print(f"{breaker.name} call failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            breaker.record_success()
+            return result
+    finally:
+        # Also covers the handler being cancelled while the thread runs
+        state.abandoned = True
+        _current_call.reset(token)
@@ -0,0 +1,100 @@
+# src/utils/send_queue.py
+import asyncio
+import functools
+import time
+from collections import Counter
+from telegram.error import RetryAfter
+
+from src.config import TELEGRAM_SEND_RATE
+
+
+class SendQueue:
+    """
+    Single consumer that delivers Telegram messages at no more than `rate` per second.
+    Each message may carry a `not_before` (monotonic time) so that a batch can be
+    spread over a period instead of being sent in one burst, and an `on_done`
+    coroutine function that is awaited with True/False once the message was
+    delivered or given up on.
+    """
+
+    def __init__(self, bot, rate: float = TELEGRAM_SEND_RATE):
+        self.bot = bot
+        self.interval = 1.0 / rate
+        self._queue = asyncio.Queue()
+        self._task = None
+        self._pending_chats = Counter()
+        self.sent = 0
+        self.failed = 0
+
+    def submit(self, chat_id: int, text: str, not_before: float = 0.0, on_done=None):
+        self._queue.put_nowait((not_before, chat_id, text, on_done))
+        self._pending_chats[chat_id] += 1
+
+    def submit_spread(self, messages: list[tuple[int, str]], spread: float, on_done=None):
+        """
+        Queues messages evenly spaced over `spread` seconds (or faster if the rate allows no less).
+        `on_done(chat_id, delivered)` is awaited after each message, if given.
+        """
+        if not messages:
+            return
+        spacing = max(spread / len(messages), self.interval)
+        start = time.monotonic()
+        for i, (chat_id, text) in enumerate(messages):
+            done = functools.partial(on_done, chat_id) if on_done else None
+            self.submit(chat_id, text, not_before=start + i * spacing, on_done=done)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def pending_chats(self) -> set[int]:
+        """Chats with a message queued or being sent right now."""
+        return set(self._pending_chats)
+
+    async def _send(self, chat_id: int, text: str):
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=text)
+        except RetryAfter as e:
+            # Telegram asked us to slow down: wait and try once more
+            retry_after = e.retry_after
+            await asyncio.sleep(retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else retry_after)
+            await self.bot.send_message(chat_id=chat_id, text=text)
+
+    async def _run(self):
+        next_slot = 0.0
+        while True:
+            not_before, chat_id, text, on_done = await self._queue.get()
+            delay = max(not_before, next_slot) - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            next_slot = time.monotonic() + self.interval
+            try:
+                delivered = False
+                try:
+                    await self._send(chat_id, text)
+                    self.sent += 1
+                    delivered = True
+                except Exception as e:
+                    self.failed += 1
+                    print(f"Failed to send message to {chat_id}: {e}")
+                if on_done:
+                    try:
+                        await on_done(delivered)
+                    except Exception as e:
+                        print(f"Error in send callback for {chat_id}: {e}")
+            finally:
+                self._pending_chats[chat_id] -= 1
+                if self._pending_chats[chat_id] <= 0:
+                    del self._pending_chats[chat_id]
+                self._queue.task_done()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1 @@
+# src/watchlist/__init__.py
@@ -0,0 +1,148 @@
+# src/watchlist/titles.py
+import asyncio
+import html
+import ipaddress
+import re
+import socket
+from urllib.parse import urljoin, urlsplit
+import httpx
+
+from src.config import TITLE_FETCH_TIMEOUT
+from src.database.crud import videos_missing_titles, set_video_titles
+
+YOUTUBE_OEMBED_URL = "https://www.youtube.com/oembed"
+MAX_HTML_BYTES = 256 * 1024   # titles live in <head>, no need to read whole pages
+MAX_REDIRECTS = 5
+
+OG_TITLE_RE = re.compile(r"<meta[^>]+property=[\"']og:title[\"'][^>]+content=[\"']([^\"']+)", re.IGNORECASE)
+TITLE_RE = re.compile(r"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+
+def parse_title(page: str) -> str | None:
+    match = OG_TITLE_RE.search(page) or TITLE_RE.search(page)
+    if not match:
+        return None
+    title = " ".join(html.unescape(match.group(1)).split())
+    return title or None
+
+async def is_public_url(url: str) -> bool:
+    """
+    True if the URL is http(s) and its host resolves only to public addresses.
+    Links come from users, so without this the bot would fetch (and show the title of)
+    localhost, the internal network or cloud metadata endpoints on their behalf.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return False
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = await asyncio.get_running_loop().getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError, ValueError):
+        return False
+    addresses = {ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos}
+    return bool(addresses) and all(address.is_global for address in addresses)
+
+
+class TitleWorker:
+    """
+    Background task that fills in titles of newly added videos.
+    Ingest never waits on the network; it just calls `notify()`.
+    The HTTP client, the oEmbed endpoint and the URL check are injectable so a local
+    stand-in server can play the part of the web. Redirects are followed by hand so
+    every hop goes through the URL check.
+    """
+
+    def __init__(self, client: httpx.AsyncClient = None, oembed_url: str = YOUTUBE_OEMBED_URL,
+                 batch_size: int = 20, concurrency: int = 5, idle_interval: float = 300,
+                 url_check=is_public_url):
+        self.client = client
+        self.oembed_url = oembed_url
+        self.url_check = url_check
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._owns_client = client is None
+
+    def notify(self):
+        """New videos were added."""
+        self._wakeup.set()
+
+    async def fetch_title(self, url: str) -> str | None:
+        async with self._semaphore:
+            try:
+                if url.startswith("https://www.youtube.com/watch?v="):
+                    response = await self.client.get(self.oembed_url, params={"url": url, "format": "json"})
+                    response.raise_for_status()
+                    return response.json().get("title") or None
+
+                return await self._fetch_page_title(url)
+            except Exception as e:
+                print(f"Failed to fetch title for {url}: {e}")
+                return None
+
+    async def _fetch_page_title(self, url: str) -> str | None:
+        for _ in range(MAX_REDIRECTS + 1):
+            if not await self.url_check(url):
+                print(f"Not fetching title of {url}: not a public address")
+                return None
+            async with self.client.stream("GET", url, follow_redirects=False) as response:
+                if response.is_redirect:
+                    url = urljoin(url, response.headers["location"])
+                    continue
+                response.raise_for_status()
+                if "html" not in response.headers.get("content-type", "html"):
+                    return None
+                chunks = []
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size >= MAX_HTML_BYTES:
+                        break
+                page = b"".join(chunks).decode(response.encoding or "utf-8", errors="replace")
+                return parse_title(page)
+        return None
+
+    async def run_once(self) -> int:
+        """Fetches one batch. Returns how many videos were looked at."""
+        videos = await videos_missing_titles(self.batch_size)
+        if not videos:
+            return 0
+        titles = await asyncio.gather(*(self.fetch_title(video.url) for video in videos))
+        await set_video_titles({video.id: title for video, title in zip(videos, titles)})
+        return len(videos)
+
+    async def _run(self):
+        while True:
+            try:
+                if await self.run_once():
+                    continue
+            except Exception as e:
+                print(f"Error in title worker: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.idle_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=TITLE_FETCH_TIMEOUT,
+                follow_redirects=False,
+                headers={"User-Agent": "Mozilla/5.0 (compatible; HopeBot/1.0)"},
+            )
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._owns_client and self.client:
+            await self.client.aclose()
+            self.client = None
@@ -0,0 +1,71 @@
+# src/watchlist/urls.py
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Query parameters that only track where a link came from
+TRACKING_PARAMS = {"fbclid", "gclid", "yclid", "igshid", "mc_cid", "mc_eid", "ref_src", "si", "feature", "pp"}
+
+YOUTUBE_HOSTS = {"youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com"}
+YOUTUBE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+def _youtube_id(host: str, path: str, query: dict) -> str | None:
+    if host == "youtu.be":
+        video_id = path.strip("/").split("/")[0]
+    elif host in YOUTUBE_HOSTS:
+        segments = path.strip("/").split("/")
+        if segments[0] == "watch":
+            video_id = query.get("v", "")
+        elif segments[0] in ("shorts", "embed", "live", "v") and len(segments) > 1:
+            video_id = segments[1]
+        else:
+            return None
+    else:
+        return None
+    return video_id if YOUTUBE_ID_RE.match(video_id) else None
+
+def normalize_url(url: str) -> str | None:
+    """
+    Canonical form used for dedup: lower-case scheme/host, no default port, no fragment,
+    no tracking parameters, sorted query. All YouTube link flavours become
+    https://www.youtube.com/watch?v=ID. Returns None for anything that isn't http(s)
+    and for links with credentials in them (user:password@host) - those aren't kept.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = "https://" + url
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower().rstrip(".")
+    if scheme not in ("http", "https") or not host:
+        return None
+    if parts.username is not None or parts.password is not None:
+        return None
+
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in TRACKING_PARAMS and not key.startswith("utm_")
+    ]
+
+    video_id = _youtube_id(host, parts.path, dict(query))
+    if video_id:
+        return f"https://www.youtube.com/watch?v={video_id}"
+
+    netloc = f"[{host}]" if ":" in host else host
+    if port and not (scheme == "http" and port == 80) and not (scheme == "https" and port == 443):
+        netloc = f"{netloc}:{port}"
+    path = parts.path or "/"
+    return urlunsplit((scheme, netloc, path, urlencode(sorted(query)), ""))
+
+def normalize_urls(urls) -> list[str]:
+    """Normalizes and de-duplicates, keeping the original order."""
+    seen = {}
+    for url in urls:
+        normalized = normalize_url(url)
+        if normalized:
+            seen.setdefault(normalized, None)
+    return list(seen)
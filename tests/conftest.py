@@ -0,0 +1,23 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+# Point the app at a throwaway database before anything imports src.config
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest_asyncio
+
+from src.database.session import async_engine, init_db
+from src.database.models import Base
+
+
+@pytest_asyncio.fixture
+async def db():
+    """Fresh schema per test; the engine is disposed so no connection outlives the test's loop."""
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await init_db()
+    yield
+    await async_engine.dispose()
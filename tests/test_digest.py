@@ -0,0 +1,146 @@
+# tests/test_digest.py
+import asyncio
+import datetime
+
+import pytest
+import pytest_asyncio
+
+from src.database.session import async_session_maker
+from src.database.models import User
+from src.digest.scheduler import run_digests
+from src.utils.send_queue import SendQueue
+
+NOW = datetime.datetime(2026, 3, 2, 8, 0)
+
+
+class RecordingQueue:
+    """Stands in for SendQueue: keeps what was submitted, delivery is up to the test."""
+
+    def __init__(self):
+        self.messages = []
+        self.callbacks = {}
+
+    def submit_spread(self, messages, spread, on_done=None):
+        self.messages.extend(messages)
+        for chat_id, _ in messages:
+            self.callbacks[chat_id] = on_done
+
+    def pending_chats(self):
+        return {chat_id for chat_id, _ in self.messages}
+
+    async def deliver(self, chat_id, delivered=True):
+        self.messages = [m for m in self.messages if m[0] != chat_id]
+        await self.callbacks.pop(chat_id)(chat_id, delivered)
+
+
+async def add_user(user_id, minute, timezone="UTC"):
+    async with async_session_maker() as session:
+        session.add(User(telegram_id=user_id, timezone=timezone, digest_minute=minute, last_synced_at=NOW))
+        await session.commit()
+
+
+@pytest_asyncio.fixture
+async def user(db):
+    await add_user(1, 8 * 60)
+    return 1
+
+
+async def digest_state(user_id):
+    async with async_session_maker() as session:
+        user = await session.get(User, user_id)
+        return user.digest_sent_on, user.digest_claimed_at
+
+
+@pytest.mark.asyncio
+async def test_digest_is_sent_once_after_delivery(user):
+    queue = RecordingQueue()
+    assert await run_digests(queue, NOW) == 1
+    # Claimed, not yet sent: another tick doesn't send it twice
+    assert await digest_state(user) == (None, NOW)
+    assert await run_digests(RecordingQueue(), NOW + datetime.timedelta(minutes=1)) == 0
+
+    await queue.deliver(user, True)
+    assert await digest_state(user) == ("2026-03-02", None)
+    assert await run_digests(RecordingQueue(), NOW + datetime.timedelta(minutes=2)) == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_send_is_retried(user):
+    queue = RecordingQueue()
+    await run_digests(queue, NOW)
+    await queue.deliver(user, False)
+    assert await digest_state(user) == (None, None)
+    assert await run_digests(RecordingQueue(), NOW + datetime.timedelta(minutes=1)) == 1
+
+
+@pytest.mark.asyncio
+async def test_lost_claim_expires(user):
+    # The replica that claimed the digest died before sending it
+    await run_digests(RecordingQueue(), NOW)
+    assert await run_digests(RecordingQueue(), NOW + datetime.timedelta(minutes=2)) == 0
+    assert await run_digests(RecordingQueue(), NOW + datetime.timedelta(minutes=4)) == 1
+
+
+@pytest.mark.asyncio
+async def test_backlog_longer_than_claim_timeout(db):
+    # Users still waiting in this process's queue keep their claim, however long it takes
+    for user_id in range(1, 4):
+        await add_user(user_id, 8 * 60)
+    queue = RecordingQueue()
+    assert await run_digests(queue, NOW) == 3
+    for minute in range(1, 6):
+        assert await run_digests(queue, NOW + datetime.timedelta(minutes=minute)) == 0
+        if minute == 4:
+            await queue.deliver(1)
+    assert queue.pending_chats() == {2, 3}
+
+    # ...until the process goes away and the claims expire
+    assert await run_digests(RecordingQueue(), NOW + datetime.timedelta(minutes=9)) == 2
+
+
+@pytest.mark.asyncio
+async def test_catch_up_past_local_midnight(db):
+    await add_user(1, 23 * 60 + 55, timezone="Europe/Prague")
+    queue = RecordingQueue()
+    # 00:03 in Prague on 2026-03-03: the 23:55 slot of the 2nd is still due
+    assert await run_digests(queue, datetime.datetime(2026, 3, 2, 23, 3)) == 1
+    await queue.deliver(1)
+    assert await digest_state(1) == ("2026-03-02", None)
+    assert await run_digests(RecordingQueue(), datetime.datetime(2026, 3, 2, 23, 4)) == 0
+    # Past the catch-up window it waits for that evening's slot
+    assert await run_digests(RecordingQueue(), datetime.datetime(2026, 3, 2, 23, 30)) == 0
+    assert await run_digests(RecordingQueue(), datetime.datetime(2026, 3, 3, 22, 55)) == 1
+
+
+class FlakyBot:
+    def __init__(self, failing):
+        self.failing = failing
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.failing:
+            raise RuntimeError("network down")
+        self.sent.append(chat_id)
+
+
+@pytest.mark.asyncio
+async def test_send_queue_reports_each_result():
+    bot = FlakyBot(failing={2})
+    queue = SendQueue(bot, rate=1000)
+    results = {}
+    finished = asyncio.Event()
+
+    async def on_done(chat_id, delivered):
+        results[chat_id] = delivered
+        if len(results) == 3:
+            finished.set()
+
+    queue.start()
+    try:
+        queue.submit_spread([(1, "a"), (2, "b"), (3, "c")], 0, on_done=on_done)
+        await asyncio.wait_for(finished.wait(), 5)
+    finally:
+        await queue.stop()
+    assert results == {1: True, 2: False, 3: True}
+    assert queue.pending_chats() == set()
+    assert (queue.sent, queue.failed) == (2, 1)
@@ -0,0 +1,75 @@
+# tests/test_free_slots.py
+import asyncio
+import datetime
+
+import pytest
+
+from src import calendar_tools
+from src.calendar import store
+from src.calendar.sync import _event_row
+from src.database.session import async_session_maker
+from src.database.models import User, CalendarEvent
+from src.utils.context import current_user_id, current_loop
+
+pytestmark = pytest.mark.asyncio
+
+USER = 5
+
+
+async def add_user(*events, synced=True):
+    async with async_session_maker() as session:
+        session.add(User(telegram_id=USER, timezone="Europe/Moscow",
+                         last_synced_at=datetime.datetime(2026, 3, 1) if synced else None))
+        for event in events:
+            session.add(CalendarEvent(**_event_row(USER, event)))
+        await session.commit()
+
+
+def timed(event_id, start, end, **extra):
+    return dict({'id': event_id, 'summary': event_id, 'status': 'confirmed',
+                 'start': {'dateTime': start, 'timeZone': "Europe/Moscow"},
+                 'end': {'dateTime': end, 'timeZone': "Europe/Moscow"}}, **extra)
+
+
+async def run_tool(*args):
+    """Calls the tool the way Gemini does: from a worker thread, with the user's context."""
+    current_user_id.set(USER)
+    current_loop.set(asyncio.get_running_loop())
+    return await asyncio.to_thread(calendar_tools.find_free_slots, *args)
+
+
+async def test_free_slots_from_the_local_copy(db):
+    await add_user(
+        timed("standup", "2026-03-02T09:00:00+03:00", "2026-03-02T10:00:00+03:00",
+              recurrence=["RRULE:FREQ=DAILY;COUNT=5"]),
+        timed("lunch", "2026-03-02T13:00:00+03:00", "2026-03-02T14:30:00+03:00"),
+        timed("focus", "2026-03-02T16:00:00+03:00", "2026-03-02T17:00:00+03:00", transparency="transparent"),
+    )
+    text = await run_tool("2026-03-02", 60)
+    assert "10:00 - 13:00" in text
+    assert "14:30 - 21:00" in text
+    assert "09:00" not in text
+
+
+async def test_free_slots_before_first_sync(db):
+    await add_user(synced=False)
+    assert "синхронизируется" in await run_tool("2026-03-02", 60)
+
+
+async def test_slow_read_is_cancelled_on_timeout(db, monkeypatch):
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def stuck(user_id):
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    monkeypatch.setattr(store, "get_calendar_state", stuck)
+    monkeypatch.setattr(calendar_tools, "GOOGLE_CALL_DEADLINE", 0.1)
+    text = await run_tool("2026-03-02", 60)
+    assert text.startswith("Ошибка поиска свободного времени")
+    await asyncio.wait_for(cancelled.wait(), 1)
@@ -0,0 +1,129 @@
+# tests/test_paging.py
+import asyncio
+import threading
+
+import pytest
+
+from src.calendar import paging
+from src.calendar.paging import EventPager, remember_listing, MAX_LISTINGS
+from src.calendar_tools import truncate_lines, format_events_list
+
+
+class FakeCalendar:
+    """Stand-in for fetch_events_page: `pages` pages of events chained by page tokens."""
+
+    def __init__(self, pages: int, fail_once: set = ()):
+        self.pages = pages
+        self.fail_once = set(fail_once)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def fetch(self, time_min, page_token=None, page_size=10):
+        with self.lock:
+            self.calls.append((time_min, page_token))
+        index = 0 if page_token is None else int(page_token[1:])
+        if index in self.fail_once:
+            self.fail_once.discard(index)
+            raise ConnectionError("flaky")
+        events = [{'id': f"p{index}e{i}"} for i in range(page_size)]
+        next_token = f"t{index + 1}" if index + 1 < self.pages else None
+        return events, next_token
+
+    def tokens_fetched(self):
+        return [token for _, token in self.calls]
+
+
+@pytest.fixture
+def calendar(monkeypatch):
+    fake = FakeCalendar(pages=3)
+    monkeypatch.setattr(paging, "fetch_events_page", fake.fetch)
+    return fake
+
+
+async def settle(pager):
+    await asyncio.gather(*pager._pages.values(), return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_next_page_comes_from_the_prefetch(calendar):
+    pager = EventPager(creds=None)
+    index, events, has_next = await pager.get_page(0)
+    assert (index, events[0]['id'], has_next) == (0, "p0e0", True)
+    assert pager.tokens == [None, "t1"]
+
+    await settle(pager)     # the prefetch of page 1 has landed
+    assert calendar.tokens_fetched() == [None, "t1"]
+    index, events, _ = await pager.get_page(1)
+    assert (index, events[0]['id']) == (1, "p1e0")
+    assert pager.tokens == [None, "t1", "t2"]
+    # Page 1 wasn't fetched again; page 2 is being prefetched
+    await settle(pager)
+    assert calendar.tokens_fetched() == [None, "t1", "t2"]
+    # One listing, one timeMin
+    assert len({time_min for time_min, _ in calendar.calls}) == 1
+
+
+@pytest.mark.asyncio
+async def test_going_back_uses_the_kept_pages(calendar):
+    pager = EventPager(creds=None)
+    for index in range(3):
+        await pager.get_page(index)
+    await settle(pager)
+    fetched = len(calendar.calls)
+    index, events, has_next = await pager.get_page(0)
+    assert (index, events[0]['id'], has_next) == (0, "p0e0", True)
+    assert len(calendar.calls) == fetched
+
+
+@pytest.mark.asyncio
+async def test_end_of_list(calendar):
+    pager = EventPager(creds=None)
+    for index in range(2):
+        await pager.get_page(index)
+    index, events, has_next = await pager.get_page(2)
+    assert (index, events[0]['id'], has_next) == (2, "p2e0", False)
+    assert pager.tokens == [None, "t1", "t2"]
+    # Beyond the end (e.g. a stale button) clamps to the last known page
+    index, _, has_next = await pager.get_page(7)
+    assert (index, has_next) == (2, False)
+
+
+@pytest.mark.asyncio
+async def test_failed_prefetch_is_retried_on_demand(monkeypatch):
+    fake = FakeCalendar(pages=3, fail_once={1})
+    monkeypatch.setattr(paging, "fetch_events_page", fake.fetch)
+    pager = EventPager(creds=None)
+    await pager.get_page(0)
+    await settle(pager)
+    index, events, _ = await pager.get_page(1)
+    assert (index, events[0]['id']) == (1, "p1e0")
+    assert fake.tokens_fetched()[:3] == [None, "t1", "t1"]
+
+
+@pytest.mark.asyncio
+async def test_each_listing_keeps_its_own_pager(calendar):
+    user_data = {}
+    first = EventPager(creds=None)
+    await first.get_page(0)
+    first_id = remember_listing(user_data, first)
+    second_id = remember_listing(user_data, EventPager(creds=None))
+    assert second_id > first_id
+    assert user_data['events_listings'][first_id] is first
+
+    for _ in range(MAX_LISTINGS):
+        remember_listing(user_data, EventPager(creds=None))
+    assert len(user_data['events_listings']) == MAX_LISTINGS
+    assert first_id not in user_data['events_listings']
+    # The evicted listing dropped its pages and pending prefetch
+    assert not first._pages
+
+
+def test_truncate_keeps_whole_lines():
+    events = [{'summary': f"Событие {i}", 'start': {'date': "2026-03-02"}} for i in range(400)]
+    text = format_events_list(events)
+    cut = truncate_lines(text, 4096)
+    assert len(cut) <= 4096
+    assert cut.endswith("\n…")
+    kept = cut[:-1].splitlines()
+    assert kept == text.splitlines()[:len(kept)]
+    assert truncate_lines("short\n", 4096) == "short\n"
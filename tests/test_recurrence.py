@@ -0,0 +1,149 @@
+# tests/test_recurrence.py
+import datetime
+
+from src.calendar.recurrence import expand, series_end
+from src.calendar.store import iter_events
+from src.calendar.sync import _event_row
+from src.database.models import CalendarEvent
+
+# Masters are written the way events.list returns them; the expected instances are what
+# the same call returns with singleEvents=True (ids, starts and ends).
+
+MSK = "Europe/Moscow"
+BERLIN = "Europe/Berlin"
+
+
+def master(recurrence, start, end, time_zone=MSK, event_id="series"):
+    if len(start) == 10:
+        return {'id': event_id, 'summary': 'Standup', 'status': 'confirmed',
+                'start': {'date': start}, 'end': {'date': end}, 'recurrence': recurrence}
+    return {'id': event_id, 'summary': 'Standup', 'status': 'confirmed',
+            'start': {'dateTime': start, 'timeZone': time_zone},
+            'end': {'dateTime': end, 'timeZone': time_zone},
+            'recurrence': recurrence}
+
+
+def instances(events):
+    return [(e['id'], e['start'].get('dateTime') or e['start']['date'],
+             e['end'].get('dateTime') or e['end']['date']) for e in events]
+
+
+def utc(*args):
+    return datetime.datetime(*args)
+
+
+WINDOW = (utc(2026, 1, 1), utc(2027, 1, 1))
+
+
+def test_count():
+    event = master(["RRULE:FREQ=WEEKLY;BYDAY=MO;COUNT=3"],
+                   "2026-03-02T09:00:00+03:00", "2026-03-02T10:00:00+03:00")
+    assert instances(expand(event, *WINDOW)) == [
+        ("series_20260302T060000Z", "2026-03-02T09:00:00+03:00", "2026-03-02T10:00:00+03:00"),
+        ("series_20260309T060000Z", "2026-03-09T09:00:00+03:00", "2026-03-09T10:00:00+03:00"),
+        ("series_20260316T060000Z", "2026-03-16T09:00:00+03:00", "2026-03-16T10:00:00+03:00"),
+    ]
+    assert series_end(event) == utc(2026, 3, 16, 7)
+
+
+def test_until_utc():
+    event = master(["RRULE:FREQ=DAILY;UNTIL=20260304T060000Z"],
+                   "2026-03-02T09:00:00+03:00", "2026-03-02T09:30:00+03:00")
+    assert [i[0] for i in instances(expand(event, *WINDOW))] == [
+        "series_20260302T060000Z", "series_20260303T060000Z", "series_20260304T060000Z",
+    ]
+    assert series_end(event) == utc(2026, 3, 4, 6, 30)
+
+
+def test_until_floating_is_local_time():
+    # 08:59 Moscow is before the 09:00 instance of the 4th, even though it is after 06:00 UTC
+    event = master(["RRULE:FREQ=DAILY;UNTIL=20260304T085900"],
+                   "2026-03-02T09:00:00+03:00", "2026-03-02T09:30:00+03:00")
+    assert [i[0] for i in instances(expand(event, *WINDOW))] == [
+        "series_20260302T060000Z", "series_20260303T060000Z",
+    ]
+    assert series_end(event) == utc(2026, 3, 3, 6, 30)
+
+
+def test_until_date_includes_that_day():
+    event = master(["RRULE:FREQ=DAILY;UNTIL=20260304"],
+                   "2026-03-02T09:00:00+03:00", "2026-03-02T09:30:00+03:00")
+    assert len(list(expand(event, *WINDOW))) == 3
+
+
+def test_exdate_and_rdate():
+    event = master([
+        "RRULE:FREQ=WEEKLY;BYDAY=MO;COUNT=3",
+        "EXDATE;TZID=Europe/Moscow:20260309T090000",
+        "RDATE;TZID=Europe/Moscow:20260311T140000",
+        "RDATE:20260320T110000Z",
+    ], "2026-03-02T09:00:00+03:00", "2026-03-02T10:00:00+03:00")
+    assert instances(expand(event, *WINDOW)) == [
+        ("series_20260302T060000Z", "2026-03-02T09:00:00+03:00", "2026-03-02T10:00:00+03:00"),
+        ("series_20260311T110000Z", "2026-03-11T14:00:00+03:00", "2026-03-11T15:00:00+03:00"),
+        ("series_20260316T060000Z", "2026-03-16T09:00:00+03:00", "2026-03-16T10:00:00+03:00"),
+        ("series_20260320T110000Z", "2026-03-20T14:00:00+03:00", "2026-03-20T15:00:00+03:00"),
+    ]
+    # The last RDATE outlives the rule
+    assert series_end(event) == utc(2026, 3, 20, 12)
+
+
+def test_dst_transition_keeps_wall_clock():
+    # Berlin switches to summer time on 2026-03-29
+    event = master(["RRULE:FREQ=DAILY;COUNT=3"],
+                   "2026-03-28T09:00:00+01:00", "2026-03-28T10:00:00+01:00", time_zone=BERLIN)
+    assert instances(expand(event, *WINDOW)) == [
+        ("series_20260328T080000Z", "2026-03-28T09:00:00+01:00", "2026-03-28T10:00:00+01:00"),
+        ("series_20260329T070000Z", "2026-03-29T09:00:00+02:00", "2026-03-29T10:00:00+02:00"),
+        ("series_20260330T070000Z", "2026-03-30T09:00:00+02:00", "2026-03-30T10:00:00+02:00"),
+    ]
+    assert series_end(event) == utc(2026, 3, 30, 8)
+
+
+def test_all_day_series():
+    event = master(["RRULE:FREQ=WEEKLY;COUNT=3", "EXDATE;VALUE=DATE:20260309"],
+                   "2026-03-02", "2026-03-04")
+    assert instances(expand(event, *WINDOW)) == [
+        ("series_20260302", "2026-03-02", "2026-03-04"),
+        ("series_20260316", "2026-03-16", "2026-03-18"),
+    ]
+    assert series_end(event) == utc(2026, 3, 18)
+    # A two-day instance still overlaps a window that starts on its second day
+    assert [i[0] for i in instances(expand(event, utc(2026, 3, 3), utc(2026, 3, 4)))] == ["series_20260302"]
+
+
+def test_unbounded_series():
+    event = master(["RRULE:FREQ=DAILY"], "2026-03-02T09:00:00+03:00", "2026-03-02T10:00:00+03:00")
+    assert series_end(event) is None
+    window = instances(expand(event, utc(2030, 6, 1), utc(2030, 6, 3)))
+    assert [i[0] for i in window] == ["series_20300601T060000Z", "series_20300602T060000Z"]
+
+
+def test_iter_events_applies_exceptions():
+    series = master(["RRULE:FREQ=DAILY;COUNT=5"],
+                    "2026-03-02T09:00:00+03:00", "2026-03-02T10:00:00+03:00")
+    moved = {
+        'id': "series_20260303T060000Z", 'summary': 'Standup (moved)', 'status': 'confirmed',
+        'recurringEventId': "series",
+        'originalStartTime': {'dateTime': "2026-03-03T09:00:00+03:00", 'timeZone': MSK},
+        'start': {'dateTime': "2026-03-03T15:00:00+03:00", 'timeZone': MSK},
+        'end': {'dateTime': "2026-03-03T16:00:00+03:00", 'timeZone': MSK},
+    }
+    # Google sends cancelled instances without start/end
+    cancelled = {
+        'id': "series_20260304T060000Z", 'status': 'cancelled', 'recurringEventId': "series",
+        'originalStartTime': {'dateTime': "2026-03-04T09:00:00+03:00", 'timeZone': MSK},
+    }
+    single = {
+        'id': "lunch", 'summary': 'Lunch', 'status': 'confirmed',
+        'start': {'dateTime': "2026-03-03T12:00:00+03:00", 'timeZone': MSK},
+        'end': {'dateTime': "2026-03-03T13:00:00+03:00", 'timeZone': MSK},
+    }
+    rows = [CalendarEvent(**_event_row(1, event)) for event in (series, moved, cancelled, single)]
+
+    assert instances(iter_events(rows, utc(2026, 3, 2), utc(2026, 3, 6))) == [
+        ("series_20260302T060000Z", "2026-03-02T09:00:00+03:00", "2026-03-02T10:00:00+03:00"),
+        ("lunch", "2026-03-03T12:00:00+03:00", "2026-03-03T13:00:00+03:00"),
+        ("series_20260303T060000Z", "2026-03-03T15:00:00+03:00", "2026-03-03T16:00:00+03:00"),
+        ("series_20260305T060000Z", "2026-03-05T09:00:00+03:00", "2026-03-05T10:00:00+03:00"),
+    ]
@@ -0,0 +1,166 @@
+# tests/test_reminders.py
+import datetime
+import math
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, update
+
+from src.calendar.sync import _event_row
+from src.database.session import async_session_maker, database_now
+from src.database.models import User, CalendarEvent, ReminderShardLease, ReminderWorker, SentReminder
+from src.reminders import leases
+from src.reminders.leases import ShardLeaser, ensure_shards, shard_of
+from src.reminders.service import send_user_reminders
+from src.state.backend import MemoryStateBackend
+
+SHARDS = leases.REMINDER_SHARDS
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def shards(db):
+    await ensure_shards()
+
+
+async def refresh_all(*leasers):
+    for leaser in leasers:
+        await leaser.refresh()
+
+
+async def owners() -> dict:
+    async with async_session_maker() as session:
+        result = await session.execute(select(ReminderShardLease.shard_id, ReminderShardLease.owner))
+        return dict(result.all())
+
+
+def assert_partitioned(*leasers):
+    owned = [leaser.owned for leaser in leasers]
+    assert sum(len(o) for o in owned) == SHARDS
+    assert set().union(*owned) == set(range(SHARDS))
+
+
+async def test_single_worker_claims_every_shard(shards):
+    worker = ShardLeaser("a")
+    assert await worker.refresh() == set(range(SHARDS))
+    assert all(worker.holds(shard_id) for shard_id in range(SHARDS))
+    assert set((await owners()).values()) == {"a"}
+
+
+async def test_newcomer_gets_its_share_after_surplus_is_handed_off(shards):
+    a, b = ShardLeaser("a"), ShardLeaser("b")
+    await a.refresh()
+    # b is counted at once but everything is still taken
+    assert await b.refresh() == set()
+    await refresh_all(a, b)
+    assert len(a.owned) == len(b.owned) == math.ceil(SHARDS / 2)
+    assert_partitioned(a, b)
+
+    c = ShardLeaser("c")
+    await refresh_all(c, a, b, c)
+    target = math.ceil(SHARDS / 3)
+    assert len(a.owned) == len(b.owned) == target
+    assert len(c.owned) == SHARDS - 2 * target
+    assert_partitioned(a, b, c)
+    assert {shard for shard, owner in (await owners()).items() if owner == "c"} == c.owned
+
+
+async def test_expired_leases_are_taken_over(shards):
+    a, b, c = ShardLeaser("a"), ShardLeaser("b"), ShardLeaser("c")
+    await refresh_all(a, b, c, a, b, c)
+
+    # a stops renewing; let its heartbeat and leases run out in the database's clock
+    async with async_session_maker() as session:
+        past = await database_now(session) - datetime.timedelta(seconds=1)
+        await session.execute(update(ReminderWorker).where(ReminderWorker.worker_id == "a").values(expires_at=past))
+        await session.execute(update(ReminderShardLease).where(ReminderShardLease.owner == "a").values(expires_at=past))
+        await session.commit()
+
+    await refresh_all(b, c)
+    assert len(b.owned) == len(c.owned) == SHARDS // 2
+    assert_partitioned(b, c)
+    assert "a" not in (await owners()).values()
+
+
+async def test_release_hands_shards_back_at_once(shards):
+    a, b = ShardLeaser("a"), ShardLeaser("b")
+    await refresh_all(a, b, a, b)
+    await a.release()
+    assert not a.holds(next(iter(b.owned)))
+    assert await b.refresh() == set(range(SHARDS))
+
+
+async def test_lapsed_lease_is_not_trusted(shards):
+    worker = ShardLeaser("a")
+    await worker.refresh()
+    worker.valid_until -= leases.REMINDER_LEASE_TTL
+    assert not worker.holds(0)
+
+
+EVENT = {'id': 'ev1', 'start': {'dateTime': '2026-03-02T09:00:00+00:00'}}
+
+
+async def ledger_row():
+    async with async_session_maker() as session:
+        return (await session.execute(select(SentReminder))).scalar_one_or_none()
+
+
+async def test_ledger_claim_confirm_unclaim(db):
+    backend = MemoryStateBackend()
+    assert await backend.claim_reminder(1, EVENT)
+    assert not await backend.claim_reminder(1, EVENT)
+
+    await backend.unclaim_reminder(1, EVENT)
+    assert await backend.claim_reminder(1, EVENT)
+    await backend.confirm_reminder(1, EVENT)
+    assert (await ledger_row()).claimed_at is None
+    assert not await backend.claim_reminder(1, EVENT)
+
+
+async def test_stale_unsent_claim_is_retried(db):
+    backend = MemoryStateBackend()
+    assert await backend.claim_reminder(1, EVENT)
+    # The claiming worker died before sending
+    async with async_session_maker() as session:
+        await session.execute(update(SentReminder).values(claimed_at=datetime.datetime(2000, 1, 1)))
+        await session.commit()
+    assert await backend.claim_reminder(1, EVENT)
+    assert not await backend.claim_reminder(1, EVENT)
+
+
+class FakeBot:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if self.fail:
+            raise RuntimeError("telegram down")
+        self.sent.append((chat_id, text))
+
+
+async def test_send_user_reminders_confirms_only_delivered(shards):
+    user_id = 7
+    soon = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=10)
+    event = {
+        'id': 'standup', 'summary': 'Standup', 'status': 'confirmed',
+        'start': {'dateTime': soon.isoformat()},
+        'end': {'dateTime': (soon + datetime.timedelta(minutes=15)).isoformat()},
+    }
+    async with async_session_maker() as session:
+        session.add(User(telegram_id=user_id, last_synced_at=datetime.datetime.utcnow()))
+        session.add(CalendarEvent(**_event_row(user_id, event)))
+        await session.commit()
+    leaser = ShardLeaser("a")
+    await leaser.refresh()
+    assert leaser.holds(shard_of(user_id))
+
+    assert await send_user_reminders(FakeBot(fail=True), user_id, leaser) == 0
+    assert await ledger_row() is None
+
+    bot = FakeBot()
+    assert await send_user_reminders(bot, user_id, leaser) == 1
+    assert (await ledger_row()).claimed_at is None
+    assert await send_user_reminders(bot, user_id, leaser) == 0
+    assert len(bot.sent) == 1
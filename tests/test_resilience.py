@@ -0,0 +1,218 @@
+# tests/test_resilience.py
+import asyncio
+import email.utils
+import threading
+import time
+from types import SimpleNamespace
+
+import httplib2
+import pytest
+from google.api_core import exceptions as api_exceptions
+from googleapiclient.errors import HttpError
+
+from src import calendar_tools
+from src.utils import resilience
+from src.utils.resilience import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, call, call_async, note_side_effect, retry_after,
+)
+
+
+def http_error(status: int, **headers) -> HttpError:
+    return HttpError(httplib2.Response({'status': status, **headers}), b'')
+
+
+class Flaky:
+    """Fake `fn`: raises the given exceptions in turn, then returns "ok"."""
+
+    def __init__(self, *failures, side_effect=False):
+        self.failures = list(failures)
+        self.side_effect = side_effect
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.side_effect:
+            note_side_effect("write")
+        if self.failures:
+            raise self.failures.pop(0)
+        return "ok"
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, "_next_delay", lambda exc, attempt: 0.0)
+
+
+def test_breaker_opens_probes_and_closes():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=0.05)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()   # the probe
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()   # only one probe at a time
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0.05)
+    breaker.before_call()
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_retry_after_seconds_and_http_date():
+    assert retry_after(http_error(429, **{'retry-after': '7'})) == 7.0
+    when = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 < retry_after(http_error(503, **{'retry-after': when})) <= 30
+    assert retry_after(http_error(503, **{'retry-after': 'soon'})) is None
+    assert retry_after(http_error(503)) is None
+
+
+def test_retry_after_from_grpc_retry_info_and_headers():
+    delay = SimpleNamespace(retry_delay=SimpleNamespace(seconds=2, nanos=500_000_000))
+    assert retry_after(api_exceptions.TooManyRequests("slow down", details=[delay])) == 2.5
+    response = SimpleNamespace(headers={'retry-after': '3'})
+    assert retry_after(api_exceptions.ServiceUnavailable("down", response=response)) == 3.0
+
+
+def test_retryable_failures_are_retried():
+    fn = Flaky(http_error(503), ConnectionError())
+    assert call(CircuitBreaker("test"), fn, deadline=5) == "ok"
+    assert fn.calls == 3
+
+
+def test_client_errors_are_not_retried():
+    fn = Flaky(http_error(400))
+    with pytest.raises(HttpError):
+        call(CircuitBreaker("test"), fn, deadline=5)
+    assert fn.calls == 1
+
+
+def test_no_retry_after_side_effect():
+    fn = Flaky(http_error(503), side_effect=True)
+    with pytest.raises(HttpError):
+        call(CircuitBreaker("test"), fn, deadline=5)
+    assert fn.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_no_async_retry_after_side_effect():
+    fn = Flaky(http_error(503), side_effect=True)
+    with pytest.raises(HttpError):
+        await call_async(CircuitBreaker("test"), fn, deadline=5)
+    assert fn.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_abandoned_call_makes_no_further_google_calls():
+    inner = Flaky()
+    in_tool = threading.Event()
+    resume = threading.Event()
+    finished = threading.Event()
+    outcome = {}
+
+    def gemini_turn():
+        # A tool that is still running when the handler stops waiting
+        in_tool.set()
+        resume.wait(5)
+        try:
+            outcome['inner'] = call(CircuitBreaker("google"), inner, deadline=5)
+        except DeadlineExceeded as e:
+            outcome['inner'] = e
+        finished.set()
+
+    with pytest.raises(DeadlineExceeded) as exc_info:
+        await call_async(CircuitBreaker("gemini"), gemini_turn, deadline=0.05)
+    # Nothing was written yet and no Google call was in progress
+    assert not exc_info.value.outcome_unknown
+
+    resume.set()
+    assert await asyncio.to_thread(finished.wait, 5)
+    assert isinstance(outcome['inner'], DeadlineExceeded)
+    assert inner.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_deadline_during_google_call_reports_unknown_outcome():
+    release = threading.Event()
+
+    def slow_write():
+        release.wait(5)
+        return "created"
+
+    def gemini_turn():
+        return call(CircuitBreaker("google"), slow_write, deadline=5)
+
+    with pytest.raises(DeadlineExceeded) as exc_info:
+        await call_async(CircuitBreaker("gemini"), gemini_turn, deadline=0.05)
+    assert exc_info.value.outcome_unknown
+    release.set()
+
+
+class FakeRequest:
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+
+    def execute(self):
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class FakeEvents:
+    """events() of a calendar where the first insert went through but its answer was lost."""
+
+    def __init__(self):
+        self.stored = {}
+        self.requests = []
+
+    def insert(self, calendarId, body):
+        self.requests.append('insert')
+        self.stored[body['id']] = dict(body, htmlLink=f"https://calendar/{body['id']}")
+        return FakeRequest(error=http_error(409))
+
+    def get(self, calendarId, eventId):
+        self.requests.append('get')
+        return FakeRequest(result=self.stored[eventId])
+
+    def list(self, **kwargs):
+        return FakeRequest(result={'items': [{'id': 'e1', 'summary': 'Dentist'}]})
+
+    def delete(self, calendarId, eventId):
+        self.requests.append('delete')
+        return FakeRequest(error=http_error(410))
+
+
+@pytest.fixture
+def fake_calendar(monkeypatch):
+    events = FakeEvents()
+    monkeypatch.setattr(calendar_tools, "get_service", lambda: SimpleNamespace(events=lambda: events))
+    return events
+
+
+def test_create_conflict_fetches_the_client_id_event(fake_calendar):
+    text = calendar_tools.create_calendar_event("Standup", "2026-03-02T09:00:00+03:00", 1)
+    assert fake_calendar.requests == ['insert', 'get']
+    (event_id,) = fake_calendar.stored
+    assert f"https://calendar/{event_id}" in text
+
+
+def test_delete_gone_counts_as_done(fake_calendar):
+    text = calendar_tools.delete_calendar_event_by_summary("dentist")
+    assert fake_calendar.requests == ['delete']
+    assert "успешно удалено" in text
@@ -0,0 +1,158 @@
+# tests/test_scheduler.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.llm.scheduler import AdaptiveLimit, GeminiScheduler, RequestShed, INTERACTIVE, VOICE
+from src.utils.resilience import DeadlineExceeded
+
+
+def test_burst_of_429s_halves_limit_once():
+    limit = AdaptiveLimit(initial=16, minimum=1, maximum=32)
+    started = time.monotonic()
+    for _ in range(10):
+        limit.on_throttled(started)
+    assert limit.limit == 8
+
+
+def test_429_after_decrease_halves_again():
+    limit = AdaptiveLimit(initial=16, minimum=1, maximum=32)
+    limit.on_throttled(time.monotonic())
+    limit.on_throttled(time.monotonic())
+    assert limit.limit == 4
+
+
+def test_fast_successes_grow_additively():
+    limit = AdaptiveLimit(initial=4, minimum=1, maximum=32, latency_target=10)
+    for _ in range(4):
+        limit.on_success(0.1, time.monotonic())
+    assert 4.9 < limit.limit < 5.1
+
+
+class Gate:
+    """Blocking stand-in for a Gemini call: records its name and waits for the gate to open."""
+
+    def __init__(self):
+        self.opened = threading.Event()
+        self.calls = []
+
+    def call(self, name):
+        self.calls.append(name)
+        assert self.opened.wait(5)
+        return name
+
+
+def single_slot_scheduler(patience=5.0):
+    return GeminiScheduler(AdaptiveLimit(initial=1, minimum=1, maximum=1),
+                           patience={INTERACTIVE: patience, VOICE: patience})
+
+
+async def occupy_slot(scheduler, gate):
+    task = asyncio.create_task(scheduler.submit(0, INTERACTIVE, gate.call, "blocker"))
+    while not gate.calls:
+        await asyncio.sleep(0.01)
+    return task
+
+
+@pytest.mark.asyncio
+async def test_submit_serves_priority_then_users_round_robin():
+    scheduler = single_slot_scheduler()
+    gate = Gate()
+    blocker = await occupy_slot(scheduler, gate)
+
+    tasks = []
+    for user_id, priority, name in [(1, INTERACTIVE, "a1"), (1, INTERACTIVE, "a2"), (1, INTERACTIVE, "a3"),
+                                    (3, VOICE, "v1"), (2, INTERACTIVE, "b1")]:
+        tasks.append(asyncio.create_task(scheduler.submit(user_id, priority, gate.call, name)))
+        await asyncio.sleep(0)
+    assert scheduler.snapshot()["queued"] == 5
+
+    gate.opened.set()
+    await asyncio.gather(blocker, *tasks)
+    assert gate.calls == ["blocker", "a1", "b1", "a2", "a3", "v1"]
+
+
+@pytest.mark.asyncio
+async def test_submit_sheds_after_patience():
+    scheduler = single_slot_scheduler(patience=0.1)
+    gate = Gate()
+    blocker = await occupy_slot(scheduler, gate)
+
+    with pytest.raises(RequestShed):
+        await scheduler.submit(1, INTERACTIVE, gate.call, "late")
+    gate.opened.set()
+    await blocker
+    assert gate.calls == ["blocker"]
+    assert scheduler.snapshot()["classes"]["interactive"]["shed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_waiting_for_user_lock_counts_against_patience():
+    scheduler = single_slot_scheduler(patience=0.1)
+    lock = asyncio.Lock()
+    await lock.acquire()    # the user's previous message is still being answered
+
+    with pytest.raises(RequestShed):
+        async with scheduler.user_turn(1, INTERACTIVE, lock):
+            pass
+    assert scheduler.snapshot()["classes"]["interactive"]["shed"] == 1
+
+    lock.release()
+    async with scheduler.user_turn(1, INTERACTIVE, lock):
+        assert await scheduler.submit(1, INTERACTIVE, lambda: "ok") == "ok"
+    assert not lock.locked()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_while_queued_returns_nothing():
+    scheduler = single_slot_scheduler()
+    gate = Gate()
+    blocker = await occupy_slot(scheduler, gate)
+
+    queued = asyncio.create_task(scheduler.submit(1, INTERACTIVE, gate.call, "cancelled"))
+    await asyncio.sleep(0.01)
+    queued.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+
+    gate.opened.set()
+    await blocker
+    assert await scheduler.submit(2, INTERACTIVE, gate.call, "next") == "next"
+    assert gate.calls == ["blocker", "next"]
+    assert scheduler.snapshot()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_abandoned_call_keeps_its_slot_until_the_thread_ends():
+    scheduler = single_slot_scheduler()
+    gate = Gate()
+    running = await occupy_slot(scheduler, gate)
+    running.cancel()    # the handler gave up, the worker thread is still inside Gemini
+    with pytest.raises(asyncio.CancelledError):
+        await running
+    assert scheduler.snapshot()["in_flight"] == 1
+    assert scheduler.snapshot()["abandoned"] == 1
+
+    waiting = asyncio.create_task(scheduler.submit(1, INTERACTIVE, lambda: "after"))
+    await asyncio.sleep(0.05)
+    assert not waiting.done()
+
+    gate.opened.set()
+    assert await waiting == "after"
+    snapshot = scheduler.snapshot()
+    assert (snapshot["in_flight"], snapshot["abandoned"]) == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_call_past_deadline_keeps_its_slot():
+    scheduler = single_slot_scheduler()
+    gate = Gate()
+    with pytest.raises(DeadlineExceeded):
+        await scheduler.submit(0, INTERACTIVE, gate.call, "slow", deadline=0.05)
+    assert scheduler.snapshot()["in_flight"] == 1
+
+    gate.opened.set()
+    assert await scheduler.submit(1, INTERACTIVE, lambda: "after") == "after"
+    assert scheduler.snapshot()["in_flight"] == 0
@@ -0,0 +1,185 @@
+# tests/test_state_backend.py
+import asyncio
+
+import fakeredis
+import pytest
+import pytest_asyncio
+from google.generativeai import protos
+
+from src.config import CHAT_HISTORY_LIMIT
+from src.state.backend import StateBackend, MemoryStateBackend
+from src.state.redis_backend import RedisStateBackend
+
+# The same contract for every backend. A "cluster" is what several replicas would
+# share: one MemoryStateBackend serves a single process, Redis replicas share a server.
+
+
+class MemoryCluster:
+    separate_processes = False
+
+    def __init__(self):
+        self.backend = MemoryStateBackend()
+
+    def replica(self):
+        return self.backend
+
+
+class RedisCluster:
+    separate_processes = True
+
+    def __init__(self):
+        self.server = fakeredis.FakeServer()
+
+    def replica(self, lock_ttl: float = 30.0):
+        return RedisStateBackend(client=fakeredis.FakeAsyncRedis(server=self.server), lock_ttl=lock_ttl)
+
+
+@pytest_asyncio.fixture(params=[MemoryCluster, RedisCluster], ids=["memory", "redis"])
+async def cluster(request):
+    cluster = request.param()
+    replicas = []
+
+    def replica():
+        backend = cluster.replica()
+        if backend not in replicas:
+            replicas.append(backend)
+        return backend
+
+    yield cluster, replica
+    for backend in replicas:
+        await backend.stop()
+
+
+async def start(backend):
+    await backend.start()
+    return backend
+
+
+def user_turn(text):
+    return protos.Content(role='user', parts=[protos.Part(text=text)])
+
+
+def model_turn(text):
+    return protos.Content(role='model', parts=[protos.Part(text=text)])
+
+
+def function_response_turn():
+    return protos.Content(role='user', parts=[protos.Part(function_response=protos.FunctionResponse(name='tool'))])
+
+
+def texts(history):
+    return [content.parts[0].text for content in history]
+
+
+@pytest.mark.asyncio
+async def test_history_append_and_load(cluster):
+    _, replica = cluster
+    backend = await start(replica())
+    assert await backend.load_history(1) == []
+
+    await backend.append_history(1, [user_turn("hi"), model_turn("hello")])
+    await backend.append_history(1, [user_turn("again")])
+    await backend.append_history(2, [user_turn("other user")])
+    assert texts(await backend.load_history(1)) == ["hi", "hello", "again"]
+    assert texts(await backend.load_history(2)) == ["other user"]
+
+
+@pytest.mark.asyncio
+async def test_history_is_trimmed_to_a_user_turn(cluster):
+    _, replica = cluster
+    backend = await start(replica())
+    turns = []
+    for i in range(CHAT_HISTORY_LIMIT // 2 + 5):
+        turns += [user_turn(f"q{i}"), model_turn(f"a{i}")]
+    await backend.append_history(1, turns)
+    history = await backend.load_history(1)
+    assert len(history) == CHAT_HISTORY_LIMIT
+    assert texts(history)[0] == "q5"
+
+    # A cut that lands inside a function-calling exchange starts at the next real question
+    await backend.append_history(1, [function_response_turn(), model_turn("done"), user_turn("next")])
+    history = await backend.load_history(1)
+    assert history[0].role == 'user' and history[0].parts[0].text.startswith("q")
+    assert texts(history)[-1] == "next"
+
+
+@pytest.mark.asyncio
+async def test_user_lock_excludes_across_replicas(cluster):
+    _, replica = cluster
+    first, second = await start(replica()), await start(replica())
+    holders = []
+
+    async def hold(backend, name):
+        async with backend.user_lock(1):
+            holders.append(name)
+            assert len(holders) == 1
+            await asyncio.sleep(0.05)
+            holders.remove(name)
+
+    await asyncio.gather(hold(first, "a"), hold(second, "b"), hold(first, "c"))
+
+    # Other users aren't blocked
+    async with first.user_lock(1):
+        await asyncio.wait_for(_enter(second.user_lock(2)), 1)
+
+
+async def _enter(lock):
+    async with lock:
+        pass
+
+
+@pytest.mark.asyncio
+async def test_try_acquire_expires(cluster):
+    _, replica = cluster
+    first, second = await start(replica()), await start(replica())
+    assert await first.try_acquire("job", ttl=0.1)
+    assert not await second.try_acquire("job", ttl=0.1)
+    assert await first.try_acquire("other-job", ttl=0.1)
+    await asyncio.sleep(0.15)
+    assert await second.try_acquire("job", ttl=0.1)
+
+
+@pytest.mark.asyncio
+async def test_invalidation_reaches_other_processes_only(cluster):
+    cluster, replica = cluster
+    publisher, subscriber = await start(replica()), await start(replica())
+    seen = {"publisher": [], "subscriber": []}
+    publisher.add_invalidation_listener(lambda kind, key: seen["publisher"].append((kind, key)))
+    if subscriber is not publisher:
+        subscriber.add_invalidation_listener(lambda kind, key: seen["subscriber"].append((kind, key)))
+    await asyncio.sleep(0.05)   # subscriptions are up
+
+    await publisher.publish_invalidation("creds", 42)
+    for _ in range(50):
+        if seen["subscriber"] or not cluster.separate_processes:
+            break
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.02)
+
+    assert seen["publisher"] == []
+    assert seen["subscriber"] == ([("creds", "42")] if cluster.separate_processes else [])
+
+
+@pytest.mark.asyncio
+async def test_redis_lock_is_renewed_while_held():
+    cluster = RedisCluster()
+    first = cluster.replica(lock_ttl=0.1)
+    second = cluster.replica(lock_ttl=0.1)
+    try:
+        async with first.user_lock(1):
+            # Several TTLs pass while the call runs; the lock must not be taken over
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(_enter(second.user_lock(1)), 0.35)
+        await asyncio.wait_for(_enter(second.user_lock(1)), 1)
+    finally:
+        await first.stop()
+        await second.stop()
+
+
+def test_incomplete_backend_cannot_be_created():
+    class HistoryOnly(StateBackend):
+        async def load_history(self, user_id):
+            return []
+
+    with pytest.raises(TypeError):
+        HistoryOnly()
@@ -0,0 +1,135 @@
+# tests/test_watch.py
+import datetime
+import pytest
+import pytest_asyncio
+
+from src.calendar import watch
+from src.calendar.watch import NotificationReceiver, LocalNotificationEmitter, start_watch, renew_channels
+from src.database.session import async_session_maker
+from src.database.models import User, WatchChannel
+
+pytestmark = pytest.mark.asyncio
+
+USER_ID = 1001
+
+
+async def _add_channel(channel_id="chan-1", expires_in=datetime.timedelta(days=3)) -> WatchChannel:
+    channel = WatchChannel(
+        channel_id=channel_id,
+        user_id=USER_ID,
+        resource_id=f"res-{channel_id}",
+        token=f"token-{channel_id}",
+        expires_at=datetime.datetime.utcnow() + expires_in,
+    )
+    async with async_session_maker() as session:
+        session.add(User(telegram_id=USER_ID))
+        session.add(channel)
+        await session.commit()
+    return channel
+
+
+@pytest.fixture
+def resyncs(monkeypatch):
+    calls = []
+    monkeypatch.setattr(watch, "request_resync", calls.append)
+    return calls
+
+
+@pytest_asyncio.fixture
+async def emitter(db):
+    receiver = NotificationReceiver("127.0.0.1", 0, path="/calendar/notify")
+    await receiver.start()
+    yield LocalNotificationEmitter("127.0.0.1", receiver.port_bound, path="/calendar/notify")
+    await receiver.stop()
+
+
+async def test_sync_handshake_does_not_resync(emitter, resyncs):
+    channel = await _add_channel()
+    assert await emitter.emit(channel, resource_state="sync") == 200
+    assert resyncs == []
+
+
+async def test_exists_notification_resyncs_user(emitter, resyncs):
+    channel = await _add_channel()
+    assert await emitter.emit(channel, resource_state="exists") == 200
+    assert resyncs == [USER_ID]
+
+
+@pytest.mark.parametrize("field", ["token", "resource_id", "channel_id"])
+async def test_unknown_channel_is_rejected(emitter, resyncs, field):
+    channel = await _add_channel()
+    forged = WatchChannel(
+        channel_id=channel.channel_id,
+        user_id=channel.user_id,
+        resource_id=channel.resource_id,
+        token=channel.token,
+        expires_at=channel.expires_at,
+    )
+    setattr(forged, field, "forged")
+    assert await emitter.emit(forged) == 404
+    assert resyncs == []
+
+
+@pytest.fixture
+def fake_google(monkeypatch):
+    """Replaces the blocking Google calls; returns (opened, closed) channel id lists."""
+    opened, closed = [], []
+
+    async def get_user_creds(user_id):
+        return object()
+
+    def open_channel(creds, channel_id, token):
+        if getattr(open_channel, "fail", False):
+            raise RuntimeError("Google is down")
+        opened.append(channel_id)
+        expiration = datetime.datetime.utcnow() + datetime.timedelta(days=7)
+        return {"resourceId": f"res-{channel_id}", "expiration": str(int(expiration.timestamp() * 1000))}
+
+    def close_channel(creds, channel_id, resource_id):
+        closed.append(channel_id)
+
+    monkeypatch.setattr(watch, "get_user_creds", get_user_creds)
+    monkeypatch.setattr(watch, "_open_channel", open_channel)
+    monkeypatch.setattr(watch, "_close_channel", close_channel)
+    monkeypatch.setattr(watch, "get_all_authenticated_users", lambda: _no_users())
+    return opened, closed, open_channel
+
+
+async def _no_users():
+    return []
+
+
+async def _channel_ids():
+    async with async_session_maker() as session:
+        result = await session.execute(WatchChannel.__table__.select())
+        return [row.channel_id for row in result]
+
+
+async def test_start_watch_replaces_previous_channel(db, fake_google):
+    opened, closed, _ = fake_google
+    await _add_channel("old")
+    channel = await start_watch(USER_ID)
+    assert closed == ["old"]
+    assert await _channel_ids() == [channel.channel_id]
+
+
+async def test_renew_keeps_old_channel_when_open_fails(db, fake_google):
+    opened, closed, open_channel = fake_google
+    await _add_channel("expiring", expires_in=datetime.timedelta(hours=2))
+    open_channel.fail = True
+    await renew_channels()
+    assert closed == []
+    assert await _channel_ids() == ["expiring"]
+
+
+async def test_renew_stops_duplicates(db, fake_google):
+    opened, closed, _ = fake_google
+    await _add_channel("newest", expires_in=datetime.timedelta(days=5))
+    async with async_session_maker() as session:
+        session.add(WatchChannel(channel_id="dup", user_id=USER_ID, resource_id="res-dup", token="t",
+                                 expires_at=datetime.datetime.utcnow() + datetime.timedelta(days=2)))
+        await session.commit()
+    await renew_channels()
+    assert opened == []
+    assert closed == ["dup"]
+    assert await _channel_ids() == ["newest"]